@@ -0,0 +1,385 @@
+import re
+import sys
+from decimal import Decimal, ROUND_HALF_UP
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from estimate import LineBatch, LineItem, exact_paise, line_cost, line_costs
+from workbook_cache import read_workbook, workbook_version
+
+ITEMS_PATH = "items.xltm"
+TEMPLATES_PATH = "Templates.xlsx"
+
+
+# 1. RATE CATALOG (ONE PARSED SHEET SHARED BY ALL SESSIONS)
+class RateCatalog:
+    """
+    Holds one parsed rate sheet from items.xltm.
+    The same object is handed to every session of the user, so callers
+    must treat everything it returns as read-only.
+    """
+
+    def __init__(self, frame, sheet_name=None, version=None):
+        self._frame = frame
+        self.sheet_name = sheet_name
+        self.version = version
+        # Tuples so a session can't append to or reorder the shared lists
+        self.item_names = tuple(frame['Item Name'].tolist())
+        # Rates in int paise, converted once here (a blank rate counts as zero)
+        unit_prices = []
+        # Line amounts use the rate as entered, so a rate with more than two decimals
+        # (₹12.345) keeps its fraction of a paisa here: row position -> Decimal paise
+        self._exact_prices = {}
+        for position, price in enumerate(frame['Unit Price'].tolist()):
+            exact = exact_paise(price) if price == price and price is not None else Decimal(0)
+            rounded = int(exact.to_integral_value(rounding=ROUND_HALF_UP))
+            unit_prices.append(rounded)
+            if exact != rounded:
+                self._exact_prices[position] = exact
+        self.unit_prices = tuple(unit_prices)
+        self.item_units = tuple(frame['Item Unit'].tolist())
+
+        # Item name -> row position (first row wins, same as .iloc[0] on a mask)
+        self._positions = {}
+        for position, name in enumerate(self.item_names):
+            self._positions.setdefault(name, position)
+        # The same mapping as arrays, for joining a whole column of names at once
+        self._name_index = pd.Index(list(self._positions), dtype=object)
+        self._name_positions = np.fromiter(self._positions.values(), dtype=np.int64, count=len(self._positions))
+        self._price_array = np.array(self.unit_prices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._frame)
+
+    @property
+    def stamp(self):
+        """(sheet name, version) of these rates as text, written into exports to tell on upload where lines were priced"""
+        version = "" if self.version is None else ":".join(str(part) for part in self.version)
+        return str(self.sheet_name), version
+
+    def position(self, item_name):
+        """Row position of an item, or None if it isn't in the catalog"""
+        return self._positions.get(item_name)
+
+    def positions(self, item_names):
+        """Row positions for a column of names in one join (-1 for names not in the catalog)"""
+        found = self._name_index.get_indexer(pd.Index(item_names, dtype=object))
+        return np.where(found >= 0, self._name_positions[found], -1)
+
+    def build_line_items(self, rows):
+        """
+        Turn an incoming frame (a template or a parsed upload) into line items.
+        Columns: 'Item Name', plus optional 'Quantity', 'Type' ('Subheading', or 'Other'
+        for a custom line kept as is), 'Remarks', 'GST' (True/False, default True) and
+        'Total Price' (rupees). Names are joined against the catalog
+        in one step and all costs computed as arrays. Catalog items with a quantity
+        become standard lines; anything else becomes an "Other" line at its total
+        price (₹0 if none). Returns (line_items, unmatched) where unmatched lists
+        {'Row', 'Item Name'} for every non-subheading name not found in the catalog.
+        """
+        count = len(rows)
+        names = rows['Item Name'].tolist()
+        positions = self.positions(names)
+
+        def column(name, default):
+            return rows[name].tolist() if name in rows else [default] * count
+
+        quantities = pd.to_numeric(rows['Quantity'], errors='coerce').to_numpy(dtype=np.float64) \
+            if 'Quantity' in rows else np.zeros(count)
+        totals = pd.to_numeric(rows['Total Price'], errors='coerce').fillna(0).to_numpy(dtype=np.float64) \
+            if 'Total Price' in rows else np.zeros(count)
+        kinds = column('Type', None)
+        is_subheading = np.array([kind == 'Subheading' for kind in kinds], dtype=bool)
+        is_other = np.array([kind == 'Other' for kind in kinds], dtype=bool)
+        remarks = [remark if isinstance(remark, str) else "" for remark in column('Remarks', "")]
+        gst = [True if value is None or value != value else bool(value) for value in column('GST', True)]
+
+        standard = (positions >= 0) & ~np.isnan(quantities) & ~is_subheading & ~is_other
+        safe_positions = np.where(standard, positions, 0)
+        rates = self._price_array[safe_positions]
+        costs = line_costs(np.where(standard, quantities, 0), np.where(standard, rates, 0))
+        for i in np.flatnonzero(standard):
+            exact = self._exact_prices.get(int(positions[i]))
+            if exact is not None:
+                costs[i] = line_cost(quantities[i], exact)
+        other_costs = line_costs(totals, np.full(count, 100))
+
+        line_items = []
+        unmatched = []
+        for i in range(count):
+            if is_subheading[i]:
+                line_items.append(LineItem.subheading(str(names[i])))
+            elif standard[i]:
+                position = positions[i]
+                # Reuse the catalog's copy of the name
+                line_items.append(LineItem.standard(
+                    self.item_names[position], quantities[i], int(rates[i]), self.item_units[position],
+                    gst[i], remarks[i], cost=int(costs[i])
+                ))
+            else:
+                line_items.append(LineItem.other(str(names[i]), int(other_costs[i]), gst[i], remarks[i]))
+                if positions[i] < 0 and not is_other[i]:
+                    unmatched.append({'Row': i + 1, 'Item Name': str(names[i])})
+        return line_items, unmatched
+
+    def lookup(self, item_name):
+        """(unit price in paise, unit) for an item, or None if it isn't in the catalog"""
+        position = self._positions.get(item_name)
+        if position is None:
+            return None
+        return self.unit_prices[position], self.item_units[position]
+
+    def cost(self, item_name, quantity):
+        """Line amount in paise for a quantity of a catalog item, from its rate as entered"""
+        position = self._positions[item_name]
+        return line_cost(quantity, self._exact_prices.get(position, self.unit_prices[position]))
+
+    def line_item(self, item_name, quantity, gst_applicable=True, remarks=""):
+        """Standard line for a catalog item (the item must be in the catalog)"""
+        unit_price, unit = self.lookup(item_name)
+        return LineItem.standard(item_name, quantity, unit_price, unit, gst_applicable, remarks,
+                                 cost=self.cost(item_name, quantity))
+
+    @cached_property
+    def search_index(self):
+        """Token index for the Smart Filter search, built on first use"""
+        return SearchIndex(self._frame)
+
+    @cached_property
+    def category_tree(self):
+        """Main -> Sub 1 -> Sub 2 hierarchy for the Smart Filter panel, built on first use"""
+        return CategoryTree(self._frame)
+
+    @property
+    def wizard_frame(self):
+        """Shallow (copy-on-write) view of the full sheet for the Smart Filter"""
+        return self._frame.copy(deep=False)
+
+    def memory_usage(self):
+        """
+        Approximate bytes held by this catalog: the frame, the name/rate/unit tuples
+        (strings included), the name index arrays, and the search index and category
+        tree if they have been built. Objects shared between structures count once.
+        """
+        seen = set()
+        total = int(self._frame.memory_usage(index=True, deep=True).sum())
+        for value in (self.item_names, self.unit_prices, self.item_units, self._positions,
+                      self._exact_prices, self._name_positions, self._price_array):
+            total += _deep_size(value, seen)
+        total += int(self._name_index.memory_usage(deep=True))
+        # cached_property keeps built values in the instance dict
+        for name in ('search_index', 'category_tree'):
+            built = self.__dict__.get(name)
+            if built is not None:
+                total += _deep_size(vars(built), seen)
+        return total
+
+
+def _deep_size(value, seen):
+    """sys.getsizeof of value and everything it holds (dicts, lists, tuples, arrays), each object once"""
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        # A view's getsizeof leaves out the data, which belongs to its base
+        return sys.getsizeof(value) + (0 if value.base is None else _deep_size(value.base, seen))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(key, seen) + _deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_deep_size(item, seen) for item in value)
+    return size
+
+
+# 2. SEARCH INDEX (TOKEN -> POSTING LIST OF ROW POSITIONS)
+SEARCH_COLUMNS = ['Item Name', 'Main Category', 'Sub Category 1', 'Sub Category 2']
+
+
+class SearchIndex:
+    """
+    Inverted index over the item name and the three category columns.
+    A search term never contains spaces, so it matches a row exactly when it
+    is a substring of one of the row's whitespace tokens. That lets a query
+    scan the (small) token vocabulary instead of every row's text.
+    """
+
+    MAX_CACHED_TERMS = 4096
+
+    def __init__(self, frame):
+        columns = [frame[column].astype(str).str.lower().tolist() for column in SEARCH_COLUMNS]
+        postings = {}
+        for position, values in enumerate(zip(*columns)):
+            for token in set(' '.join(values).split()):
+                postings.setdefault(token, []).append(position)
+
+        self._postings = {token: np.array(rows, dtype=np.int64) for token, rows in postings.items()}
+        self._tokens = tuple(self._postings)
+        self._empty = np.array([], dtype=np.int64)
+        self._term_cache = {}
+
+    def term_positions(self, term):
+        """Sorted row positions whose text contains the (lowercase) term"""
+        cached = self._term_cache.get(term)
+        if cached is not None:
+            return cached
+
+        matches = [self._postings[token] for token in self._tokens if term in token]
+        if not matches:
+            result = self._empty
+        elif len(matches) == 1:
+            result = matches[0]
+        else:
+            result = np.unique(np.concatenate(matches))
+
+        if len(self._term_cache) >= self.MAX_CACHED_TERMS:
+            self._term_cache.clear()
+        self._term_cache[term] = result
+        return result
+
+    def search(self, query):
+        """Sorted row positions matching every term of the query (in any order), None if it has no terms"""
+        result = None
+        for term in set(query.lower().split()):
+            positions = self.term_positions(term)
+            result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+
+# 3. CATEGORY HIERARCHY (MAIN -> SUB 1 -> SUB 2 WITH ITEM COUNTS)
+def extract_prefix_number(s):
+    match = re.match(r"^\s*(\d+)\.", s)
+    return int(match.group(1)) if match else float('inf')  # Non-numbered items go last
+
+
+class CategoryTree:
+    """
+    Category hierarchy computed once per catalog so the filter panel never has
+    to copy the frame or run unique() on a rerun. Missing categories are kept
+    as None nodes so their items still count towards the levels below.
+    """
+
+    def __init__(self, frame):
+        columns = ['Main Category', 'Sub Category 1', 'Sub Category 2']
+        values = frame[columns].astype(object)
+        values = values.where(values.notna(), None)
+
+        self.main_counts = {}   # main -> item count
+        self._sub1 = {}         # main -> {sub1: [first row, item count]}
+        self._sub2 = {}         # (main, sub1) -> {sub2: item count}
+        self._rows = {column: {} for column in columns}  # column -> {value: [row positions]}
+
+        for position, (main, sub1, sub2) in enumerate(values.itertuples(index=False, name=None)):
+            self.main_counts[main] = self.main_counts.get(main, 0) + 1
+            node = self._sub1.setdefault(main, {}).setdefault(sub1, [position, 0])
+            node[1] += 1
+            children = self._sub2.setdefault((main, sub1), {})
+            children[sub2] = children.get(sub2, 0) + 1
+            for column, value in zip(columns, (main, sub1, sub2)):
+                self._rows[column].setdefault(value, []).append(position)
+
+        self._rows = {
+            column: {value: np.array(rows, dtype=np.int64) for value, rows in by_value.items()}
+            for column, by_value in self._rows.items()
+        }
+        self.main_categories = sorted(main for main in self.main_counts if main is not None)
+
+    def all_values(self, column):
+        """Every non-empty value of a category column"""
+        return [value for value in self._rows[column] if value is not None]
+
+    def sub1_options(self, main_categories):
+        """(sub1, item count) under the selected mains (all if none), numeric-prefix order"""
+        sources = [self._sub1[main] for main in main_categories if main in self._sub1] \
+            if main_categories else self._sub1.values()
+        merged = {}
+        for children in sources:
+            for sub1, (first_row, count) in children.items():
+                if sub1 is None:
+                    continue
+                if sub1 in merged:
+                    merged[sub1][0] = min(merged[sub1][0], first_row)
+                    merged[sub1][1] += count
+                else:
+                    merged[sub1] = [first_row, count]
+        # Numbered groups by prefix, ties keep the order they first appear in the sheet
+        ordered = sorted(merged.items(), key=lambda entry: (extract_prefix_number(entry[0]), entry[1][0]))
+        return [(sub1, count) for sub1, (_, count) in ordered]
+
+    def sub2_options(self, main_categories, sub1_categories):
+        """(sub2, item count) under the selected mains and sub1s, alphabetical"""
+        counts = {}
+        for (main, sub1), children in self._sub2.items():
+            if main_categories and main not in main_categories:
+                continue
+            if sub1_categories and sub1 not in sub1_categories:
+                continue
+            for sub2, count in children.items():
+                if sub2 is not None:
+                    counts[sub2] = counts.get(sub2, 0) + count
+        return sorted(counts.items())
+
+    def filter_positions(self, main_categories, sub1_categories, sub2_categories):
+        """Sorted row positions passing all three category filters (empty filter = no restriction)"""
+        result = None
+        for column, selected in (('Main Category', main_categories),
+                                 ('Sub Category 1', sub1_categories),
+                                 ('Sub Category 2', sub2_categories)):
+            if not selected:
+                continue
+            by_value = self._rows[column]
+            parts = [by_value[value] for value in selected if value in by_value]
+            positions = np.unique(np.concatenate(parts)) if parts else np.array([], dtype=np.int64)
+            result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+        return result
+
+
+# 4. PRE-RESOLVED TEMPLATES
+class ResolvedTemplate:
+    """A template already matched against one user's catalog, ready to append"""
+
+    def __init__(self, name, line_items, unmatched):
+        self.name = name
+        self.batch = LineBatch(line_items)
+        self.unmatched = unmatched
+
+    @property
+    def total(self):
+        """Sum of the template's line costs, in paise"""
+        return self.batch.subtotal
+
+
+# 5. SHARED LOADERS (PARSED ONCE PER SHEET/VERSION FOR THE WHOLE PROCESS)
+# Entries are keyed by file version, so every edit of items.xltm or Templates.xlsx
+# leaves the old ones unreachable. Keeping a few times the number of user sheets
+# lets the least recently used (stale) versions drop out without thrashing live ones.
+MAX_CACHED_SHEETS = 32
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_SHEETS)
+def _load_catalog(sheet_name, version):
+    return RateCatalog(read_workbook(ITEMS_PATH, sheet_name=sheet_name), sheet_name, version)
+
+
+def get_catalog(sheet_name):
+    """Parse a user's sheet once and share the catalog across sessions (re-read if items.xltm changes)"""
+    return _load_catalog(sheet_name, workbook_version(ITEMS_PATH))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_SHEETS)
+def _resolve_templates(sheet_name, catalog_version, templates_version, _catalog):
+    frames = read_workbook(TEMPLATES_PATH, sheet_name=None)
+    return {name: ResolvedTemplate(name, *_catalog.build_line_items(frame)) for name, frame in frames.items()}
+
+
+def get_templates(catalog):
+    """
+    Every template resolved against this catalog: name -> ResolvedTemplate.
+    Built on first use per (user sheet, items.xltm version, Templates.xlsx version)
+    and shared across that user's sessions.
+    """
+    return _resolve_templates(catalog.sheet_name, catalog.version, workbook_version(TEMPLATES_PATH), catalog)
@@ -0,0 +1,569 @@
+import hashlib
+import json
+import sys
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import numpy as np
+
+
+# 1. MONEY (INTEGER PAISE)
+# Every amount in an estimate is an int number of paise (₹1 = 100), so sums are
+# exact and need no Decimal/float conversions. Rupee values are converted once
+# when they come in (catalog, text inputs, uploads) and formatted on the way out.
+def exact_paise(amount):
+    """Rupee amount (int, float, str or Decimal) -> Decimal paise, not rounded"""
+    try:
+        value = Decimal(str(amount).strip().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"'{amount}' is not a valid amount")
+    if not value.is_finite():
+        raise ValueError(f"'{amount}' is not a valid amount")
+    return value * 100
+
+
+def to_paise(amount):
+    """Rupee amount (int, float, str or Decimal) -> int paise, rounded half up"""
+    return int(exact_paise(amount).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def line_cost(quantity, unit_price_paise):
+    """
+    Quantity x rate in paise, rounded half up to the nearest paisa. The rate may be
+    a Decimal with a fraction of a paisa (a rate entered with more than two decimals).
+    """
+    quantity = Decimal(repr(float(quantity)))
+    if not quantity.is_finite():
+        raise ValueError(f"'{quantity}' is not a valid quantity")
+    return int((quantity * unit_price_paise).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def line_costs(quantities, unit_prices_paise):
+    """
+    line_cost() over whole arrays. Float products are only trusted where they sit
+    clearly away from a half-paisa tie; the few that don't go through line_cost().
+    """
+    quantities = np.asarray(quantities, dtype=np.float64)
+    raw = quantities * np.asarray(unit_prices_paise, dtype=np.float64)
+    costs = np.floor(raw + 0.5)
+    tolerance = 1e-6 + np.abs(raw) * 1e-12
+    for i in np.flatnonzero(np.abs(raw - np.floor(raw) - 0.5) <= tolerance):
+        costs[i] = line_cost(quantities[i], int(unit_prices_paise[i]))
+    return costs.astype(np.int64)
+
+
+def rupees(paise):
+    """Paise -> float rupees, for Excel cells and other numeric outputs"""
+    return paise / 100
+
+
+def format_money(paise, grouping=True):
+    """Paise -> '12,345.67' (or '12345.67' without grouping), exact for any size"""
+    sign = '-' if paise < 0 else ''
+    whole, fraction = divmod(abs(paise), 100)
+    return f"{sign}{whole:,}.{fraction:02d}" if grouping else f"{sign}{whole}.{fraction:02d}"
+
+
+def _divide_half_up(numerator, denominator):
+    """numerator / denominator rounded half away from zero (like ROUND_HALF_UP)"""
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if remainder * 2 >= denominator:
+        quotient += 1
+    return -quotient if numerator < 0 else quotient
+
+
+def _divide_half_even(numerator, denominator):
+    """numerator / denominator rounded half to even (Decimal's default quantize)"""
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+# 2. TOTALS
+GST_PERCENT = 18
+UNFORESEEN_CAP = 10000 * 100      # ₹10,000
+ROUND_TO = 1000 * 100             # final total is a multiple of ₹1,000
+
+
+def round_unforeseen(subtotal_with_gst, base_unforeseen):
+    """
+    Find the largest unforeseen amount <= base_unforeseen (in paise, not below
+    zero) that makes subtotal_with_gst + unforeseen a multiple of ₹1,000.
+    Same answer as stepping the base down one paisa at a time, in constant
+    time. Returns (unforeseen, final_total) in paise, or None if no step works.
+    """
+    if base_unforeseen < 0:
+        return None
+    remainder = -subtotal_with_gst % ROUND_TO
+    if remainder > base_unforeseen:
+        return None
+    unforeseen = remainder + (base_unforeseen - remainder) // ROUND_TO * ROUND_TO
+    return unforeseen, subtotal_with_gst + unforeseen
+
+
+def compute_totals(total_cost, taxable_amount):
+    """
+    Ensures the final total (total_cost + gst + unforeseen) is a multiple of 1000
+    by adjusting unforeseen <= ₹10,000 downward. All amounts in paise.
+    """
+    gst = _divide_half_up(taxable_amount * GST_PERCENT, 100)
+
+    # Base unforeseen = 1% of total cost, capped at ₹10,000
+    base_unforeseen = min(_divide_half_even(total_cost, 100), UNFORESEEN_CAP)
+
+    # Adjust unforeseen downward to make final_total a multiple of 1000
+    rounded = round_unforeseen(total_cost + gst, base_unforeseen)
+
+    if rounded is not None:
+        unforeseen, final_total = rounded
+    else:
+        # Fallback: no amount in range works
+        unforeseen = 0
+        final_total = total_cost + gst
+
+    return total_cost, gst, unforeseen, final_total
+
+
+# 3. LINE ITEMS
+STANDARD = 'Standard'
+OTHER = 'Other'
+SUBHEADING = 'Subheading'
+ITEM_TYPES = (STANDARD, OTHER, SUBHEADING)
+
+
+class LineItem:
+    """
+    One row of the estimate: a catalog item, a custom ("Other") item or a subheading.
+    Slotted to keep large estimates small in session state; text is interned so
+    repeated names and units (and names taken from the catalog) share one string.
+    unit_price and cost are int paise.
+    """
+
+    __slots__ = ('item_type', 'name', 'quantity', 'unit_price', 'unit', 'cost', 'gst_applicable', 'remarks')
+
+    def __init__(self, item_type, name, quantity=None, unit_price=None, unit=None, cost=None,
+                 gst_applicable=True, remarks=""):
+        if item_type not in ITEM_TYPES:
+            raise ValueError(f"Unknown line item type: {item_type}")
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("Line item needs a description")
+
+        self.item_type = item_type
+        self.name = sys.intern(name)
+        self.remarks = remarks or ""
+        self.gst_applicable = bool(gst_applicable)
+
+        if item_type == STANDARD:
+            if quantity is None or unit_price is None:
+                raise ValueError(f"'{name}' needs a quantity and a unit price")
+            self.quantity = float(quantity)
+            self.unit_price = int(unit_price)
+            self.unit = sys.intern(str(unit)) if unit is not None else ""
+            self.cost = int(cost) if cost is not None else line_cost(self.quantity, self.unit_price)
+        else:
+            self.quantity = None
+            self.unit_price = None
+            self.unit = None
+            self.cost = int(cost) if item_type == OTHER and cost is not None else 0
+
+    @classmethod
+    def standard(cls, name, quantity, unit_price, unit, gst_applicable=True, remarks="", cost=None):
+        return cls(STANDARD, name, quantity, unit_price, unit, cost, gst_applicable, remarks)
+
+    @classmethod
+    def other(cls, name, cost, gst_applicable=True, remarks=""):
+        return cls(OTHER, name, cost=cost, gst_applicable=gst_applicable, remarks=remarks)
+
+    @classmethod
+    def subheading(cls, name):
+        return cls(SUBHEADING, name)
+
+    @property
+    def is_subheading(self):
+        return self.item_type == SUBHEADING
+
+    def with_remarks(self, remarks):
+        """Copy of this line with new remarks (lines can be shared, so they're never edited in place)"""
+        copy = object.__new__(LineItem)
+        for slot in LineItem.__slots__:
+            setattr(copy, slot, getattr(self, slot))
+        copy.remarks = remarks or ""
+        return copy
+
+
+class LineBatch:
+    """
+    Read-only run of line items with its sums worked out up front, so it can be
+    appended to any number of estimates without another pass over the lines.
+    """
+
+    __slots__ = ('line_items', 'subtotal', 'taxable', 'item_count', 'has_subheadings')
+
+    def __init__(self, line_items):
+        self.line_items = tuple(line_items)
+        lines = [item for item in self.line_items if not item.is_subheading]
+        self.subtotal = sum(item.cost for item in lines)
+        self.taxable = sum(item.cost for item in lines if item.gst_applicable)
+        self.item_count = len(lines)
+        self.has_subheadings = len(lines) != len(self.line_items)
+
+    def __len__(self):
+        return len(self.line_items)
+
+    def __iter__(self):
+        return iter(self.line_items)
+
+
+# 4. ESTIMATE (LINE ITEMS + RUNNING TOTALS, UPDATED ON EVERY EDIT)
+class Estimate:
+    """
+    Ordered line items plus their subtotal, taxable subtotal, line count and
+    per-section subtotals (all int paise). Every change goes through one of the methods below,
+    which edit the list and adjust the sums in the same step, so totals never
+    need a full pass over the items.
+    sections[0] collects lines above the first subheading, sections[i] the
+    lines under the i-th subheading; each entry is [heading, subtotal, lines].
+    version goes up on every edit.
+    """
+
+    def __init__(self, line_items=()):
+        self._items = []
+        self.clear()
+        self.extend(line_items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    # Bookkeeping helpers
+    def _changed(self):
+        self.version += 1
+        self._totals = None
+        self._fingerprint = None
+        self._render = None
+
+    def _section_before(self, index):
+        """Section that a line at this index belongs to"""
+        return sum(1 for item in self._items[:index] if item.is_subheading)
+
+    def _add_line(self, section, item, sign=1):
+        cost = item.cost if sign > 0 else -item.cost
+        self.subtotal += cost
+        if item.gst_applicable:
+            self.taxable += cost
+        self.item_count += sign
+        self.sections[section][1] += cost
+        self.sections[section][2] += sign
+
+    def _move_line(self, item, source, target):
+        self.sections[source][1] -= item.cost
+        self.sections[source][2] -= 1
+        self.sections[target][1] += item.cost
+        self.sections[target][2] += 1
+
+    # Edits
+    def _append(self, item):
+        if item.is_subheading:
+            self.sections.append([item.name, 0, 0])
+        else:
+            self._add_line(len(self.sections) - 1, item)
+        self._items.append(item)
+
+    def append(self, item):
+        self._append(item)
+        self._changed()
+
+    def extend(self, line_items):
+        """Append a batch as one edit (one version bump, totals recomputed once)"""
+        if isinstance(line_items, LineBatch) and not line_items.has_subheadings:
+            # Sums are already known: add them instead of walking the lines
+            self._items.extend(line_items.line_items)
+            self.subtotal += line_items.subtotal
+            self.taxable += line_items.taxable
+            self.item_count += line_items.item_count
+            self.sections[-1][1] += line_items.subtotal
+            self.sections[-1][2] += line_items.item_count
+        else:
+            for item in line_items:
+                self._append(item)
+        self._changed()
+
+    def insert(self, index, item):
+        section = self._section_before(index)
+        if item.is_subheading:
+            # Lines after the insert point up to the next subheading move into the new section
+            moved = [item.name, 0, 0]
+            for line in self._items[index:]:
+                if line.is_subheading:
+                    break
+                moved[1] += line.cost
+                moved[2] += 1
+            self.sections[section][1] -= moved[1]
+            self.sections[section][2] -= moved[2]
+            self.sections.insert(section + 1, moved)
+        else:
+            self._add_line(section, item)
+        self._items.insert(index, item)
+        self._changed()
+
+    def pop(self, index):
+        item = self._items[index]
+        section = self._section_before(index)
+        if item.is_subheading:
+            # Its lines fall back into the section above
+            heading, subtotal, lines = self.sections.pop(section + 1)
+            self.sections[section][1] += subtotal
+            self.sections[section][2] += lines
+        else:
+            self._add_line(section, item, sign=-1)
+        self._changed()
+        return self._items.pop(index)
+
+    def replace(self, index, item):
+        old = self._items[index]
+        if old.is_subheading and item.is_subheading:
+            self.sections[self._section_before(index) + 1][0] = item.name
+            self._items[index] = item
+        elif not old.is_subheading and not item.is_subheading:
+            section = self._section_before(index)
+            self._add_line(section, old, sign=-1)
+            self._add_line(section, item)
+            self._items[index] = item
+        else:
+            self.pop(index)
+            self.insert(index, item)
+        self._changed()
+
+    def swap(self, index, other):
+        """Swap two neighbouring entries"""
+        first = min(index, other)
+        upper, lower = self._items[first], self._items[first + 1]
+        section = self._section_before(first)
+        if upper.is_subheading and lower.is_subheading:
+            # The section between them is empty, only the headings trade places
+            self.sections[section + 1][0], self.sections[section + 2][0] = lower.name, upper.name
+        elif lower.is_subheading:
+            self._move_line(upper, section, section + 1)
+        elif upper.is_subheading:
+            self._move_line(lower, section + 1, section)
+        self._items[first], self._items[first + 1] = lower, upper
+        self._changed()
+
+    def set_remarks(self, index, remarks):
+        self._items[index] = self._items[index].with_remarks(remarks)
+        self._changed()
+
+    def assign(self, line_items):
+        """Replace every line as one edit (one version bump), e.g. a bulk edit from the grid"""
+        version = self.version
+        self.clear()
+        for item in line_items:
+            self._append(item)
+        self.version = version
+        self._changed()
+
+    def clear(self):
+        self._items.clear()
+        self.subtotal = 0
+        self.taxable = 0
+        self.item_count = 0
+        self.sections = [[None, 0, 0]]
+        self.version = getattr(self, 'version', 0) + 1
+        self._totals = None
+        self._fingerprint = None
+        self._render = None
+
+    # Views
+    def totals(self):
+        """(total_cost, gst, unforeseen, final_total) in paise, recomputed only after an edit"""
+        if self._totals is None:
+            self._totals = compute_totals(self.subtotal, self.taxable)
+        return self._totals
+
+    def fingerprint(self):
+        """SHA-256 of every line's contents, recomputed only after an edit"""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for item in self._items:
+                digest.update(repr(tuple(getattr(item, slot) for slot in LineItem.__slots__)).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def render_model(self):
+        """Display rows and totals for the exports and the preview, rebuilt only after an edit"""
+        if self._render is None:
+            self._render = RenderModel(self._items, self.totals())
+        return self._render
+
+    def section_subtotals(self):
+        """(heading, line count, subtotal paise) per subheading; lines above the first one come first as 'General'"""
+        rows = []
+        for heading, subtotal, lines in self.sections:
+            if heading is None and lines == 0:
+                continue
+            rows.append((heading if heading is not None else "General", lines, subtotal))
+        return rows
+
+
+# 5. RENDER MODEL (ONE SET OF DISPLAY ROWS FOR EXCEL, PDF AND PREVIEW)
+TOTAL_LABELS = ("Subtotal", f"GST ({GST_PERCENT}%)", "Unforeseen (1%)", "Grand Total")
+
+
+class RenderRow:
+    """
+    One row as every output shows it: serial numbers, the "-" fields of Other
+    items and quantity-with-remarks are worked out here and nowhere else.
+    cells: the printed text (Sl.No, Item Name, Rate, Unit, Qty, Total);
+    values: the Excel cells (Sl.No, Item Name, Rate, Unit, Qty, Total, GST) with
+    numbers left as numbers. A subheading has one cell/value and no serial.
+    """
+
+    __slots__ = ('item_type', 'serial', 'name', 'cells', 'values')
+
+    def __init__(self, item, serial=None):
+        self.item_type = item.item_type
+        self.serial = serial
+        self.name = item.name
+
+        if item.is_subheading:
+            self.cells = self.values = (f" {item.name}",)
+            return
+
+        remark = item.remarks
+        total_text = format_money(item.cost, grouping=False)
+        if not item.gst_applicable:
+            total_text += " (No GST)"
+        gst_text = "Yes" if item.gst_applicable else "No"
+
+        if item.item_type == OTHER:
+            quantity = f"- ({remark})" if remark else "-"
+            self.cells = (str(serial), item.name, "-", "-", quantity, total_text)
+            self.values = (serial, item.name, "-", "-", quantity, rupees(item.cost), gst_text)
+        else:
+            quantity_text = f"{item.quantity:.2f} ({remark})" if remark else f"{item.quantity:.2f}"
+            quantity_value = f"{item.quantity} ({remark})" if remark else item.quantity
+            self.cells = (str(serial), item.name, format_money(item.unit_price, grouping=False),
+                          item.unit, quantity_text, total_text)
+            self.values = (serial, item.name, rupees(item.unit_price), item.unit, quantity_value,
+                           rupees(item.cost), gst_text)
+
+    @property
+    def is_subheading(self):
+        return self.item_type == SUBHEADING
+
+
+class RenderModel:
+    """
+    The whole estimate as display rows plus labelled totals (label, paise), built
+    in one pass. Read-only: the Excel writer, PDF writer and preview all read the
+    same rows, so they can't disagree on what a line says.
+    """
+
+    __slots__ = ('rows', 'totals')
+
+    def __init__(self, line_items, totals):
+        rows = []
+        serial = 0
+        for item in line_items:
+            if item.is_subheading:
+                rows.append(RenderRow(item))
+            else:
+                serial += 1
+                rows.append(RenderRow(item, serial))
+        self.rows = tuple(rows)
+        self.totals = tuple(zip(TOTAL_LABELS, totals))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+# 6. ROUND-TRIP RECORDS (HIDDEN SHEET OF EXPORTED WORKBOOKS)
+# Exported workbooks carry a hidden sheet with every line as a compact JSON record,
+# so uploading one of our own estimates rebuilds it exactly (quantities, rates,
+# costs, GST flags, remarks) in one read, without guessing from the visible layout.
+METADATA_SHEET = "_estimate_lines"
+METADATA_MARK = "estimate-drafter"
+METADATA_VERSION = 1
+RECORD_CHUNK = 32000  # characters per cell (Excel allows 32,767)
+
+
+def encode_records(line_items):
+    """Line items -> JSON text split into cell-sized chunks (amounts in paise)"""
+    records = []
+    for item in line_items:
+        if item.is_subheading:
+            records.append([item.item_type, item.name])
+        else:
+            records.append([item.item_type, item.name, item.quantity, item.unit_price, item.unit,
+                            item.cost, item.gst_applicable, item.remarks])
+    text = json.dumps(records, ensure_ascii=False, separators=(',', ':'))
+    return [text[start:start + RECORD_CHUNK] for start in range(0, len(text), RECORD_CHUNK)]
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_record(item_type, quantity, unit_price, cost, gst_applicable, remarks):
+    """
+    The records sit in an editable file next to the digest that is meant to vouch
+    for them, so every line is checked the way the app would have built it.
+    """
+    if not _is_int(cost) or not isinstance(gst_applicable, bool) or not isinstance(remarks, str):
+        raise TypeError("Malformed line record")
+    if item_type != STANDARD:
+        return
+    if not isinstance(quantity, (int, float)) or isinstance(quantity, bool) or not _is_int(unit_price):
+        raise TypeError("Malformed line record")
+    if not quantity > 0 or quantity == float('inf') or unit_price < 0:
+        raise ValueError("Line record with an invalid quantity or rate")
+    # A catalog rate with more than two decimals is costed from the exact rate,
+    # which is within half a paisa of the stored one (see catalog.RateCatalog)
+    if abs(cost - line_cost(quantity, unit_price)) > quantity / 2 + 1:
+        raise ValueError("Line record whose amount doesn't match its quantity and rate")
+
+
+def decode_records(chunks):
+    """encode_records() chunks -> line items (ValueError/TypeError if they don't describe valid lines)"""
+    line_items = []
+    for record in json.loads("".join(chunks)):
+        if record[0] == SUBHEADING:
+            line_items.append(LineItem.subheading(record[1]))
+        else:
+            item_type, name, quantity, unit_price, unit, cost, gst_applicable, remarks = record
+            _check_record(item_type, quantity, unit_price, cost, gst_applicable, remarks)
+            line_items.append(LineItem(item_type, name, quantity, unit_price, unit, cost, gst_applicable, remarks))
+    return line_items
+
+
+class RowDigest:
+    """
+    SHA-256 over a sheet's cell values, normalised the way they read back from
+    the file ('' -> None, numbers to 15 significant digits so 2 == 2.0, trailing
+    blanks dropped, empty rows skipped).
+    The exporter stores the digest of the visible sheet next to the records; a
+    mismatch on upload means the sheet was edited and the records are stale.
+    """
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+
+    def update(self, values):
+        row = [None if value == "" else
+               f"{value:.15g}" if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+               for value in values]
+        while row and row[-1] is None:
+            row.pop()
+        if row:
+            self._digest.update(repr(row).encode())
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from estimate import Estimate
+from exports import build_excel, build_pdf, export_key
+
+# Pool size and queue depth, overridable from the environment. Exports run on
+# these few threads only, so a burst of Generate clicks (month-end) waits in
+# the queue instead of tying up the threads that serve interactive reruns.
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "2"))
+EXPORT_QUEUE_DEPTH = int(os.environ.get("EXPORT_QUEUE_DEPTH", "8"))
+# How long a finished file stays available for download (seconds)
+JOB_TTL = 15 * 60
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ExportQueueFull(RuntimeError):
+    """Every worker is busy and the queue is at its limit"""
+
+
+# 1. JOBS
+class ExportJob:
+    """
+    One Excel/PDF export. status moves queued -> running -> done/failed;
+    progress is 0..1, error holds the message if failed. The file itself lives
+    only in the ExportCache under job.key (see ExportPool.result).
+    """
+
+    def __init__(self, kind, key):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.error = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def report(self, fraction):
+        self.progress = fraction
+
+
+# 2. POOL
+class ExportPool:
+    """
+    Bounded background pool for exports, shared by every session.
+    submit_* returns a job straight away; the page polls it by id. Files go
+    through the shared ExportCache, so an unchanged estimate finishes at once
+    and a file already being built for the same content is joined, not rebuilt.
+    """
+
+    def __init__(self, cache, workers=EXPORT_WORKERS, queue_depth=EXPORT_QUEUE_DEPTH):
+        self.cache = cache
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._jobs = {}    # job id -> job
+        self._active = {}  # content key -> queued or running job
+        self._lock = threading.Lock()
+
+    def submit(self, kind, key, prepare):
+        """
+        Queue the export for key, or raise ExportQueueFull if the pool is saturated.
+        prepare() is only called when the file really has to be built, and returns build(progress).
+        """
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job is not None:
+                return job
+
+            job = ExportJob(kind, key)
+            if self.cache.peek(key) is not None:
+                job.status, job.progress = DONE, 1.0
+                job.finished_at = time.monotonic()
+            else:
+                if len(self._active) >= self.workers + self.queue_depth:
+                    raise ExportQueueFull("Too many exports are in progress, please try again in a moment")
+                self._active[key] = job
+                self._executor.submit(self._run, job, prepare())
+            self._jobs[job.id] = job
+            return job
+
+    # The key comes from the live estimate, whose fingerprint is memoised, so a repeat
+    # click costs no hashing. Only a cache miss takes a snapshot: line items are
+    # immutable, so a shallow copy keeps later edits out of the job.
+    def submit_excel(self, estimate, estimate_heading, rates=None):
+        def prepare():
+            snapshot = Estimate(list(estimate))
+            return lambda progress: build_excel(snapshot, estimate_heading, progress, rates)
+        return self.submit("xlsx", export_key("xlsx", estimate, estimate_heading, rates), prepare)
+
+    def submit_pdf(self, estimate, estimate_heading, username, cost_index):
+        def prepare():
+            snapshot = Estimate(list(estimate))
+            return lambda progress: build_pdf(snapshot, estimate_heading, username, cost_index, progress)
+        return self.submit("pdf", export_key("pdf", estimate, estimate_heading, username, cost_index), prepare)
+
+    def job(self, job_id):
+        """The job with this id, or None once it has expired"""
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def result(self, job):
+        """File bytes of a finished job, or None if the cache has dropped them since"""
+        return self.cache.peek(job.key)
+
+    def pending(self):
+        """Number of jobs queued or running"""
+        with self._lock:
+            return len(self._active)
+
+    def _run(self, job, build):
+        job.status = RUNNING
+        try:
+            self.cache.get(job.key, lambda: build(job.report))
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        else:
+            job.progress = 1.0
+            job.status = DONE
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                self._active.pop(job.key, None)
+
+    def _prune(self):
+        """Forget finished jobs older than JOB_TTL (caller holds the lock)"""
+        cutoff = time.monotonic() - JOB_TTL
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
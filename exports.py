@@ -0,0 +1,574 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from fpdf import FPDF
+try:
+    # Only needed for the page-chrome forms (PageChrome), which fall back to
+    # plain drawing if these fpdf2 internals ever move
+    from fpdf.enums import PDFResourceType
+    from fpdf.syntax import Name, PDFArray, PDFContentStream
+except ImportError:
+    PDFResourceType = Name = PDFArray = PDFContentStream = None
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, Side
+
+from estimate import (OTHER, format_money, rupees, METADATA_SHEET, METADATA_MARK, METADATA_VERSION,
+                      RowDigest, encode_records)
+
+# Exports are built in memory and handed back as bytes, so every session
+# gets its own file and nothing is written to the shared working directory.
+EXCEL_MIME = "application/vnd.ms-excel"
+PDF_MIME = "application/pdf"
+# Bump when the layout of either export changes, so cached files aren't reused
+EXPORT_VERSION = 5
+# Lines between progress callbacks while a file is being built
+PROGRESS_EVERY = 100
+
+
+# 1. EXCEL (WRITE-ONLY WORKBOOK, ONE PASS, SHARED STYLES)
+EXCEL_COLUMNS = 7  # Sl.No, Item Name, Rate, Unit, Qty, Total, GST
+_THIN = Side(style='thin')
+CELL_STYLE = NamedStyle(
+    name="estimate_cell",
+    font=Font(name="Calibri", size=11, family=2, scheme="minor"),
+    alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+    border=Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN),
+)
+TITLE_STYLE = NamedStyle(
+    name="estimate_title",
+    font=Font(name="Calibri", size=14, bold=True, family=2, scheme="minor"),
+    alignment=CELL_STYLE.alignment,
+    border=CELL_STYLE.border,
+)
+
+
+def build_excel(estimate, estimate_heading, progress=None, rates=None):
+    """
+    The estimate as an .xlsx workbook (bytes).
+    Rows are streamed into a write-only sheet and every cell points at one of
+    two named styles, so there's no second pass to style cells one by one.
+    A hidden sheet carries the lines as records for lossless re-upload (see upload_parser),
+    with rates (RateCatalog.stamp) naming the rates they were priced from.
+    progress, if given, is called with the fraction of lines written so far.
+    """
+    model = estimate.render_model()
+
+    wb = Workbook(write_only=True)
+    wb.add_named_style(CELL_STYLE)
+    wb.add_named_style(TITLE_STYLE)
+    ws = wb.create_sheet("Estimate")
+    ws.column_dimensions['B'].width = 70
+    # The row count is known up front (title, headers, lines, 4 totals). Write-only
+    # sheets otherwise leave out <dimension>, and read-only openpyxl then scans each
+    # sheet in full as the workbook opens, before anything is read (~30x slower for
+    # 5000 lines). openpyxl 3.1's writer takes the size from ws.calculate_dimension(),
+    # hence the pin in requirements.txt; if a later version stops asking, the file is
+    # still valid, only slower to upload again.
+    last_row = len(model) + 6
+    ws.calculate_dimension = lambda: f"A1:G{last_row}"
+    digest = RowDigest()
+
+    def row(values, style="estimate_cell"):
+        """Append a full-width row (blank cells still carry the border)"""
+        digest.update(values)
+        cells = []
+        for value in list(values) + [None] * (EXCEL_COLUMNS - len(values)):
+            cell = WriteOnlyCell(ws, value)
+            cell.style = style
+            cells.append(cell)
+        ws.append(cells)
+
+    # Header
+    ws.merged_cells.add('A1:G1')
+    row([estimate_heading], style="estimate_title")
+
+    # Table headers
+    row(["Sl.No", "Item Name", "Rate", "Unit", "Qty", "Total", "GST"])
+
+    # Add items
+    row_num = 3
+    for position, line in enumerate(model.rows):
+        if progress is not None and position % PROGRESS_EVERY == 0:
+            progress(position / len(model))
+        if line.is_subheading:
+            ws.merged_cells.add(f'A{row_num}:G{row_num}')
+        row(line.values)
+        row_num += 1
+
+    # Add totals
+    for label, val in model.totals:
+        ws.merged_cells.add(f'A{row_num}:E{row_num}')
+        row([label, None, None, None, None, rupees(val)])
+        row_num += 1
+
+    # Line records for re-upload, tied to the visible sheet by its digest
+    records = wb.create_sheet(METADATA_SHEET)
+    records.sheet_state = 'hidden'
+    records.append([METADATA_MARK, METADATA_VERSION, len(estimate), digest.hexdigest()] + list(rates or ()))
+    for chunk in encode_records(estimate):
+        records.append([chunk])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+# 2. PDF
+COL_WIDTHS = [10, 70, 20, 20, 20, 30]
+HEADERS = ["Sl.No", "Item Name", "Rate", "Unit", "Qty", "Total"]
+
+
+def add_watermark(pdf):
+    """Function to add a diagonal watermark to every page"""
+    pdf.set_font("Arial", style='B', size=72)
+    pdf.set_text_color(180, 240, 230)  # Light magenta color for watermark
+
+    text = "GROUND WATER DEPARTMENT"
+
+    # Set the rotation angle for the watermark (diagonal, bottom-left to top-right)
+    pdf.rotate(54.8, x=0, y=pdf.h)  # Rotate around the bottom-left corner
+
+    # Position the text starting from the bottom-left corner with a little padding
+    x = 0  # Padding from the left
+    y = pdf.h  # Padding from the bottom
+
+    # Print the watermark diagonally
+    pdf.text(x, y, text)
+
+    # Reset rotation to avoid affecting other content
+    pdf.rotate(0)
+
+    pdf.set_text_color(0, 0, 0)  # Black color for the main content
+
+
+class TextLayout:
+    """
+    Measures and wraps text for the PDF table with cached glyph widths.
+    For the built-in fonts a string's width is just the sum of its glyph widths,
+    so words are measured once per font and a line's width is added up from its
+    words - the same numbers pdf.get_string_width() gives, without its per-call
+    overhead. Anything else (TTF fonts, stretching, spacing) falls back to fpdf.
+    """
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self._fonts = {}  # (family, style, size) -> (glyph widths, word widths)
+
+    def _font(self):
+        pdf = self.pdf
+        if pdf.is_ttf_font or pdf.font_stretching != 100 or pdf.char_spacing != 0:
+            return None
+        key = (pdf.font_family, pdf.font_style, pdf.font_size_pt)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = (pdf.current_font.cw, {})
+        return font
+
+    def _units(self, font, word):
+        glyphs, words = font
+        units = words.get(word)
+        if units is None:
+            units = words[word] = sum(glyphs[char] for char in word)
+        return units
+
+    def _to_width(self, units):
+        # Same arithmetic (and order) as fpdf's core-font width
+        return units * self.pdf.font_size_pt * 0.001 / self.pdf.k
+
+    def width(self, text):
+        """Width of a string in the current font"""
+        font = self._font()
+        if font is None:
+            return self.pdf.get_string_width(text)
+        return self._to_width(self._units(font, self.pdf.normalize_text(text)))
+
+    def wrap(self, text, max_width):
+        """Split text into lines narrower than max_width (greedy, word by word)"""
+        if not isinstance(text, str):
+            text = str(text)
+        font = self._font()
+        lines = []
+        current_line = ""
+        current_units = 0
+        for word in text.split():
+            test_line = current_line + " " + word if current_line else word
+            if font is None:
+                test_width = self.pdf.get_string_width(test_line)
+            else:
+                word_units = self._units(font, self.pdf.normalize_text(word))
+                test_units = current_units + self._units(font, " ") + word_units if current_line else word_units
+                test_width = self._to_width(test_units)
+            if test_width < max_width:
+                current_line = test_line
+                current_units = test_units if font is not None else 0
+            else:
+                lines.append(current_line)
+                current_line = word
+                current_units = word_units if font is not None else 0
+        if current_line:
+            lines.append(current_line)
+        return lines
+
+    def row(self, row_data, col_widths):
+        """Wrapped lines for every cell of a table row, plus the row height in lines"""
+        cells = [self.wrap(text, width - 2) for text, width in zip(row_data, col_widths)]
+        return cells, max([1] + [len(lines) for lines in cells])
+
+
+def draw_table_header(pdf):
+    """Draw the table header on new pages"""
+    pdf.set_font("Arial", 'B', 10)
+    x_start = pdf.get_x()
+    y_start = pdf.get_y()
+    pdf.rect(x_start, y_start, sum(COL_WIDTHS), 6)  # Header border
+
+    for i in range(1, len(COL_WIDTHS)):
+        pdf.line(
+            x_start + sum(COL_WIDTHS[:i]), y_start,
+            x_start + sum(COL_WIDTHS[:i]), y_start + 6
+        )
+
+    for i, header in enumerate(HEADERS):
+        pdf.set_xy(x_start + sum(COL_WIDTHS[:i]), y_start)
+        pdf.cell(COL_WIDTHS[i], 6, header, align='C')
+
+    pdf.set_y(y_start + 6)
+
+
+class _FormResources:
+    """Font resources of a page-chrome form, resolved once fpdf has numbered the font objects"""
+
+    def __init__(self, font_ids):
+        self.font_ids = sorted(font_ids)
+
+    def get_resource_dictionary(self, gfxstate_objs, pattern_objs, shading_objs, font_objs, img_objs):
+        fonts = "".join(f"/F{i} {font_objs[i].id} 0 R" for i in self.font_ids)
+        return f"<</Font <<{fonts}>>>>"
+
+
+class PageChrome:
+    """
+    Page decoration (watermark, repeated table header) drawn once and reused.
+    The second time a piece of chrome is drawn at a given spot its content stream
+    is lifted off the page into a Form XObject; from then on every page just
+    stamps it with one `Do` operator, so the watermark text and header grid are
+    stored in the file once instead of once per page.
+    This leans on fpdf2 internals (tested with the 2.8 series pinned in
+    requirements.txt); if they aren't there or don't behave (forms_supported),
+    or recording a form fails, the chrome is simply drawn on every page.
+    """
+
+    def __init__(self, pdf, enabled=None):
+        self.pdf = pdf
+        self.enabled = forms_supported() if enabled is None else enabled
+        self._forms = {}  # (draw, x, y) -> False after one use, then (xobject index, state after drawing)
+
+    def stamp(self, draw):
+        """Draw `draw(pdf)` at the current position, reusing its form after the first time"""
+        pdf = self.pdf
+        if not self.enabled:
+            draw(pdf)
+            return
+
+        key = (draw, pdf.get_x(), pdf.get_y())
+        form = self._forms.get(key)
+        if form is None:
+            # Chrome that only shows up once (one-page estimates) stays inline
+            self._forms[key] = False
+            draw(pdf)
+            return
+        if form is False:
+            form = self._forms[key] = self._record(draw)
+            if form is None:
+                # Couldn't make a form: it was drawn inline, and stays that way from now on
+                self.enabled = False
+                return
+
+        index, (x, y, font) = form
+        pdf._out(f"/I{index} Do")
+        pdf._resource_catalog.add(PDFResourceType.X_OBJECT, index, pdf.page)
+        pdf.set_xy(x, y)
+        pdf.set_font(*font)
+
+    def _record(self, draw):
+        pdf = self.pdf
+        contents = pdf.pages[pdf.page].contents
+        start = len(contents)
+        draw(pdf)
+        stream = bytes(contents[start:])
+        try:
+            catalog = pdf._resource_catalog
+            xobject = PDFContentStream(contents=stream, compress=pdf.compress)
+            xobject.type = Name("XObject")
+            xobject.subtype = Name("Form")
+            xobject.b_box = PDFArray([0, 0, round(pdf.w_pt, 2), round(pdf.h_pt, 2)])
+            font_ids = {font.i for font in pdf.fonts.values() if f"/F{font.i} ".encode() in stream}
+            xobject._blend_group = _FormResources(font_ids)  # fpdf fills /Resources from this
+            xobject._registered = False
+            index = catalog.next_xobject_index
+            catalog.form_xobjects.append((index, xobject))
+            catalog.next_xobject_index += 1
+        except Exception:
+            # Leave what was just drawn on the page
+            return None
+        del contents[start:]
+        # The Tf operators went into the form, so the page must set its font again
+        pdf.current_font_is_set_on_page = False
+
+        state = (pdf.get_x(), pdf.get_y(), (pdf.font_family, pdf.font_style, pdf.font_size_pt))
+        return index, state
+
+
+_forms_ok = None
+
+def forms_supported():
+    """
+    Whether PageChrome's form stamping works with the installed fpdf2. Checked once per
+    process on a throwaway two-page document: the form must come out with its font
+    in /Resources, otherwise its text would silently render without a font.
+    """
+    global _forms_ok
+    if _forms_ok is None:
+        try:
+            pdf = FPDF()
+            pdf.compress = False
+            pdf.set_font("helvetica", size=8)
+            chrome = PageChrome(pdf, enabled=PDFContentStream is not None)
+            draw = lambda pdf: pdf.cell(20, 5, "probe")
+            for _ in range(2):
+                pdf.add_page()
+                pdf.set_xy(10, 10)
+                chrome.stamp(draw)
+            out = bytes(pdf.output())
+            _forms_ok = chrome.enabled and b"/I1 Do" in out and b"/Resources <</Font <</F1 " in out
+        except Exception:
+            _forms_ok = False
+    return _forms_ok
+
+
+def build_pdf(estimate, estimate_heading, username, cost_index, progress=None):
+    """The estimate as a PDF document (bytes); progress works as in build_excel"""
+    model = estimate.render_model()
+    col_widths = COL_WIDTHS
+
+    pdf = FPDF()
+    layout = TextLayout(pdf)
+    chrome = PageChrome(pdf)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    chrome.stamp(add_watermark)
+    # Main content
+    pdf.set_font("Arial", 'B', 16)
+    pdf.set_text_color(0, 0, 0)
+
+    # Add user info at top right
+    pdf.set_font("Arial", '', 10)
+    user_info = f"User: {username}\nCost Index: {cost_index}"
+    pdf.set_xy(pdf.w - 60, 15)  # Position at top right with some margin
+    pdf.multi_cell(50, 5, user_info, 0, 'R')  # Right-aligned multi-cell for multiple lines
+
+    # Center the main heading below the user info
+    pdf.set_y(40)  # Move down a bit from top
+    pdf.set_font("Arial", 'B', 16)
+
+    # If heading is too wide for page (with 20mm margins on each side)
+    if layout.width(estimate_heading) > (pdf.w - 40):
+        # Split heading into multiple lines, each written centered
+        for line in layout.wrap(estimate_heading, pdf.w - 40):
+            pdf.cell(200, 10, txt=line, ln=True, align='C')
+    else:
+        # Single line if it fits
+        pdf.cell(200, 10, txt=estimate_heading, ln=True, align='C')
+
+    pdf.ln(10)
+    chrome.stamp(draw_table_header)
+    pdf.set_font("Arial", '', 10)
+
+    for position, line in enumerate(model.rows):
+        if progress is not None and position % PROGRESS_EVERY == 0:
+            progress(position / len(model))
+
+        # Check if we need a new page (with buffer for row height)
+        if pdf.get_y() + 20 > pdf.h - 30:  # Increased buffer to 20
+            pdf.add_page()
+            chrome.stamp(add_watermark)
+            chrome.stamp(draw_table_header)
+            pdf.set_font("Arial", '', 10)  # Reset font after header
+
+        if line.is_subheading:
+            pdf.set_font("Arial", 'B', 10)  # Subheading bold
+            pdf.set_xy(pdf.get_x(), pdf.get_y())
+            pdf.cell(sum(col_widths), 6, line.cells[0], border=1, align='C')
+            pdf.ln(6)
+            pdf.set_font("Arial", '', 10)
+            continue  # Skip to next item after subheading
+
+        row_data = line.cells
+
+        x_row_start = pdf.get_x()
+        y_row_start = pdf.get_y()
+
+        # Every cell is wrapped once; the same lines size the row and get drawn
+        cell_lines, max_lines = layout.row(row_data, col_widths)
+        row_height = 6 * max_lines
+
+        # Ensure we have space for this row
+        if pdf.get_y() + row_height > pdf.h - 30:
+            pdf.add_page()
+            chrome.stamp(add_watermark)
+            chrome.stamp(draw_table_header)
+            pdf.set_font("Arial", '', 10)
+            x_row_start = pdf.get_x()
+            y_row_start = pdf.get_y()
+
+        # Draw the row border
+        pdf.rect(x_row_start, y_row_start, sum(col_widths), row_height)
+
+        # Draw vertical lines
+        for i in range(1, len(col_widths)):
+            pdf.line(
+                x_row_start + sum(col_widths[:i]), y_row_start,
+                x_row_start + sum(col_widths[:i]), y_row_start + row_height
+            )
+
+        # If the item type is "Other", circle the serial number
+        if line.item_type == OTHER:
+            x = x_row_start + col_widths[0] / 2
+            y = y_row_start + row_height / 2
+            r = 4  # radius
+            pdf.ellipse(x - r, y - r, r * 2, r * 2)
+
+        pdf.set_xy(x_row_start, y_row_start)
+        pdf.cell(col_widths[0], row_height, row_data[0], align='C')
+
+        for i in range(1, len(row_data)):  # Start from index 1 (skip serial number)
+            pdf.set_xy(x_row_start + sum(col_widths[:i]), y_row_start)
+
+            vertical_offset = (row_height - (6 * len(cell_lines[i]))) / 2
+
+            for text_line in cell_lines[i]:
+                pdf.set_xy(x_row_start + sum(col_widths[:i]), y_row_start + vertical_offset)
+                pdf.cell(col_widths[i], 6, text_line, align='C')
+                vertical_offset += 6
+
+        pdf.set_y(y_row_start + row_height)
+
+    # Summary Section
+    for label, paise in model.totals:
+        value = format_money(paise, grouping=False)
+        row_height = 8
+        if pdf.get_y() + row_height > pdf.h - 30:
+            pdf.add_page()
+            chrome.stamp(add_watermark)
+            pdf.set_font("Arial", '', 10)  # Reset the correct font and size
+
+        x = pdf.get_x()
+        y = pdf.get_y()
+
+        # Set bold font for summary items
+        pdf.set_font("Arial", 'B', 10)  # Changed to bold
+
+        # Draw both label and value in the same row
+        pdf.set_xy(x, y)
+        pdf.cell(sum(col_widths[:-1]), row_height, label, border=1, align='C')
+
+        pdf.set_xy(x + sum(col_widths[:-1]), y)
+        pdf.cell(col_widths[-1], row_height, value, border=1, align='C')
+
+        # Move to next line
+        pdf.set_y(y + row_height)
+
+    # Signature Area
+    if pdf.get_y() + 20 > pdf.h - 30:
+        pdf.add_page()
+
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_xy(pdf.w - 70, pdf.h - 40)
+    pdf.cell(60, 10, "District Officer", ln=True, align='C')
+    pdf.set_xy(pdf.w - 70, pdf.h - 30)
+    pdf.cell(60, 10, "(Seal & Signature)", ln=True, align='C')
+
+    return bytes(pdf.output())
+
+
+# 3. EXPORT CACHE (CONTENT HASH -> FILE BYTES)
+def export_key(kind, estimate, *context):
+    """
+    SHA-256 over everything that ends up in the file: export kind and version,
+    the extra context (heading, user, cost index), every line and the totals.
+    """
+    payload = (kind, EXPORT_VERSION) + context + (estimate.fingerprint(), estimate.totals())
+    return hashlib.sha256(repr(payload).encode()).hexdigest()
+
+
+class ExportCache:
+    """
+    LRU of generated files bounded by total bytes. Keys are content hashes, so
+    one cache can be shared by every session: an unchanged estimate is served
+    from here however often Generate is clicked.
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> bytes
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def peek(self, key):
+        """Cached bytes for key, or None (counts as a use)"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def get(self, key, build):
+        """Cached bytes for key, calling build() only on a miss"""
+        data = self.peek(key)
+        if data is not None:
+            return data
+
+        # Build outside the lock; two sessions racing on one key just build it twice
+        data = build()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return data
+
+
+# 4. BENCHMARK
+def sample_estimate(lines):
+    """Synthetic estimate: `lines` catalog lines with a subheading every 50 and some Other items"""
+    from estimate import Estimate, LineItem
+    items = []
+    for i in range(lines):
+        if i % 50 == 0:
+            items.append(LineItem.subheading(f"Section {i // 50 + 1}"))
+        if i % 10 == 9:
+            items.append(LineItem.other(f"Other work {i}", 150000 + i, remarks="lump sum"))
+        else:
+            items.append(LineItem.standard(f"Item {i} as per specification", i % 9 + 1, 12345 + i, "Nos",
+                                           remarks="site" if i % 3 == 0 else ""))
+    return Estimate(items)
+
+
+if __name__ == "__main__":
+    # python exports.py [lines ...]
+    import sys
+    import time
+
+    for lines in [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]:
+        estimate = sample_estimate(lines)
+        started = time.perf_counter()
+        data = build_excel(estimate, "Benchmark estimate")
+        print(f"{lines} lines: Excel {time.perf_counter() - started:.3f}s, {len(data) / 1024:.0f} KB")
@@ -0,0 +1,162 @@
+import math
+
+import pandas as pd
+import streamlit as st
+
+from estimate import LineItem, STANDARD, OTHER, format_money
+
+GRID_COLUMNS = ("Order", "Type", "Item", "Quantity", "Unit", "Rate", "Amount", "GST", "Remarks", "Remove")
+# Columns the grid lets you change; the rest are shown read-only
+EDITABLE_COLUMNS = ("Order", "Quantity", "GST", "Remarks", "Remove")
+
+# 1. GRID ROWS
+def grid_frame(estimate):
+    """One row per line of the estimate, in order"""
+    rows = []
+    for position, item in enumerate(estimate, start=1):
+        rows.append({
+            "Order": position,
+            "Type": item.item_type,
+            "Item": item.name,
+            "Quantity": item.quantity,
+            "Unit": item.unit or "",
+            "Rate": format_money(item.unit_price, grouping=False) if item.unit_price is not None else "",
+            "Amount": "" if item.is_subheading else format_money(item.cost, grouping=False),
+            "GST": None if item.is_subheading else item.gst_applicable,
+            "Remarks": "" if item.is_subheading else item.remarks,
+            "Remove": False,
+        })
+    return pd.DataFrame(rows, columns=GRID_COLUMNS)
+
+
+# 2. BATCH DIFF
+def apply_grid_edits(estimate, edited_rows, catalog=None):
+    """
+    Apply the grid's edited cells ({row: {column: value}}, as st.data_editor reports them)
+    to the estimate as one edit. Only the edited rows are looked at.
+    Returns (number of lines changed, errors); nothing is applied if there are errors.
+    A line given the Order of another line takes its place: in front of it when moving
+    up, after it when moving down. A new quantity is
+    costed from the catalog's rate as entered while the line still has that rate.
+    """
+    items = list(estimate)
+    order = {}  # row -> new order value
+    removed = set()
+    changed = 0
+    errors = []
+
+    for row, edits in edited_rows.items():
+        row = int(row)
+        item = items[row]
+        label = f"Line {row + 1} ({item.name})"
+
+        if edits.get("Remove"):
+            removed.add(row)
+            changed += 1
+            continue
+        if "Order" in edits:
+            value = edits["Order"]
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                errors.append(f"{label}: enter an order number")
+            else:
+                order[row] = float(value)
+        if item.is_subheading:
+            continue
+
+        quantity = item.quantity
+        if item.item_type == STANDARD and "Quantity" in edits:
+            quantity = edits["Quantity"]
+            if quantity is None or (isinstance(quantity, float) and math.isnan(quantity)) or quantity <= 0:
+                errors.append(f"{label}: quantity must be more than 0")
+                continue
+        gst_applicable = bool(edits.get("GST", item.gst_applicable))
+        remarks = edits.get("Remarks", item.remarks) or ""
+
+        if (quantity, gst_applicable, remarks) == (item.quantity, item.gst_applicable, item.remarks):
+            continue
+        if item.item_type == OTHER:
+            items[row] = LineItem.other(item.name, item.cost, gst_applicable, remarks)
+        else:
+            # Keep the stored cost unless the quantity changed
+            if quantity == item.quantity:
+                cost = item.cost
+            elif catalog is not None and catalog.lookup(item.name) == (item.unit_price, item.unit):
+                cost = catalog.cost(item.name, quantity)
+            else:
+                cost = None
+            items[row] = LineItem.standard(item.name, quantity, item.unit_price, item.unit,
+                                           gst_applicable, remarks, cost=cost)
+        changed += 1
+
+    if errors:
+        return 0, errors
+
+    moved = [row for row, value in order.items() if value != row + 1]
+    if moved:
+        changed += len(moved)
+        # Lines keep their number unless moved; a moved line sorts before the line
+        # already at its new number when moving up and after it when moving down
+        def sort_key(row):
+            if row not in order:
+                return row + 1, 1, row
+            return order[row], 0 if order[row] < row + 1 else 2, row
+
+        positions = sorted((row for row in range(len(items)) if row not in removed), key=sort_key)
+    else:
+        positions = [row for row in range(len(items)) if row not in removed]
+
+    if changed:
+        estimate.assign(items[row] for row in positions)
+    return changed, []
+
+
+# 3. GRID EDITOR COMPONENT
+def show_grid_editor(estimate, catalog):
+    """
+    Every line of the estimate in one editable table. Edits are held in the table
+    until "Apply changes", which applies them all as one edit and reruns the page once;
+    the number of widgets stays the same whatever the size of the estimate.
+    """
+    if 'grid_nonce' not in st.session_state:
+        st.session_state.grid_nonce = 0
+
+    def discard():
+        st.session_state.grid_nonce += 1
+
+    # A new key after every apply/discard starts the table over from the estimate
+    key = f"estimate_grid_{estimate.version}_{st.session_state.grid_nonce}"
+
+    st.data_editor(
+        grid_frame(estimate),
+        key=key,
+        hide_index=True,
+        use_container_width=True,
+        num_rows="fixed",
+        disabled=[column for column in GRID_COLUMNS if column not in EDITABLE_COLUMNS],
+        column_config={
+            "Order": st.column_config.NumberColumn(
+                "Order", min_value=1, step=1, width="small",
+                help="Give a line the order number of another line to move it to that place"),
+            "Quantity": st.column_config.NumberColumn(
+                "Quantity", min_value=0.0, help="Only used for items from the rate list"),
+            "GST": st.column_config.CheckboxColumn("GST", width="small"),
+            "Remarks": st.column_config.TextColumn("Remarks", max_chars=100),
+            "Remove": st.column_config.CheckboxColumn("Remove", width="small"),
+        },
+    )
+
+    edited_rows = st.session_state[key]["edited_rows"]
+    col1, col2, col3 = st.columns([2, 2, 6])
+    with col1:
+        if st.button("✅ Apply changes", key="apply_grid", disabled=not edited_rows):
+            changed, errors = apply_grid_edits(estimate, edited_rows, catalog)
+            if errors:
+                st.error("Nothing was changed:\n\n" + "\n\n".join(errors))
+            else:
+                st.session_state.grid_nonce += 1
+                st.rerun()
+    with col2:
+        st.button("↩️ Discard", key="discard_grid", disabled=not edited_rows, on_click=discard)
+    with col3:
+        if edited_rows:
+            st.caption(f"{len(edited_rows)} line(s) edited, not applied yet")
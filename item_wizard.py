@@ -1,6 +1,16 @@
+import os
+
+import numpy as np
 import pandas as pd
 import streamlit as st
-from streamlit.components.v1 import html
+import streamlit.components.v1 as components
+
+from catalog import RateCatalog
+
+# Result cards for one page, rendered in a single frame (see item_cards/index.html)
+_item_cards = components.declare_component(
+    "item_cards", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "item_cards")
+)
 
 # 1. DATA LOADING (CACHED FOR PERFORMANCE)
 @st.cache_data
@@ -22,14 +32,21 @@ def load_item_data():
     }
     return pd.DataFrame(data)
 
+@st.cache_resource
+def load_item_catalog():
+    """Wrap the demo data in a catalog so the search index is built only once"""
+    return RateCatalog(load_item_data())
+
 # 2. ITEM WIZARD COMPONENT
-def show_item_wizard(items_df, add_callback):
+def show_item_wizard(catalog, add_callback):
     """
     Displays the Smart Filter with filters and pagination
     Parameters:
-    - items_df: Your pandas DataFrame of items
+    - catalog: RateCatalog of items (its search index is shared across reruns)
     - add_callback: Function to call when "Add" button is clicked
     """
+    items_df = catalog.wizard_frame
+    category_tree = catalog.category_tree
     
     # CSS Styling for the wizard
     st.markdown("""
@@ -53,28 +70,6 @@ def show_item_wizard(items_df, add_callback):
             color: #333;
             font-size: 0.9rem;
         }
-        .item-card {
-            padding: 0.7rem;
-            margin: 0.3rem 0;
-            border: 1px solid #ddd;
-            border-radius: 0.3rem;
-            background-color: white;
-        }
-        .item-title {
-            font-weight: 600;
-            font-size: 0.95rem;
-            margin-bottom: 0.2rem;
-        }
-        .item-categories {
-            color: #666;
-            font-size: 0.8rem;
-            margin-bottom: 0.3rem;
-        }
-        .item-price {
-            font-weight: 500;
-            color: #2e7d32;
-            font-size: 0.85rem;
-        }
         .results-count {
             color: #666;
             margin-bottom: 0.5rem;
@@ -86,28 +81,6 @@ def show_item_wizard(items_df, add_callback):
         .pagination-button {
             margin: 0 0.2rem;
         }
-        .copy-btn {
-            background-color: #f0f2f6;
-            border: none;
-            color: #262730;
-            padding: 0.5rem 1rem;
-            margin-top: 0.25rem;
-            margin-bottom: 0.25rem;
-            border-radius: 0.5rem;
-            font-size: 0.875rem;
-            cursor: pointer;
-            width: 100%;
-            text-align: center;
-            transition: background-color 0.2s ease;
-        }
-        .copy-btn:hover {
-            background-color: #e4e8ef;
-        }
-        .item-title-container {
-            display: flex;
-            align-items: center;
-            gap: 0.5rem;
-        }
     </style>
     """, unsafe_allow_html=True)
 
@@ -135,9 +108,9 @@ def show_item_wizard(items_df, add_callback):
                     'sub1_categories': [],
                     'sub2_categories': []
                 }
-            # Clear All Filters button
-            if st.button("🧹 Clear All Filters", key="clear_filters", use_container_width=True,
-                        help="Reset all filters to their default state"):
+            # Clear All Filters button (a callback, so the reset takes effect on this same
+            # run and the wizard's fragment doesn't need a second rerun)
+            def clear_filters():
                 # Reset all filter selections
                 st.session_state.wizard_filters = {
                     'main_categories': [],
@@ -146,25 +119,24 @@ def show_item_wizard(items_df, add_callback):
                 }
                 
                 # Clear all checkbox states
-                main_categories = sorted(items_df['Main Category'].dropna().unique().tolist())
-                for category in main_categories:
+                for category in category_tree.main_categories:
                     st.session_state[f"main_{category}"] = False
                 
-                sub1_options = items_df['Sub Category 1'].dropna().unique().tolist()
-                for sub1 in sub1_options:
+                for sub1 in category_tree.all_values('Sub Category 1'):
                     st.session_state[f"sub1_{sub1}"] = False
                     
-                sub2_options = items_df['Sub Category 2'].dropna().unique().tolist()
-                for sub2 in sub2_options:
+                for sub2 in category_tree.all_values('Sub Category 2'):
                     st.session_state[f"sub2_{sub2}"] = False
                     
                 st.session_state.current_page = 1
-                st.rerun()
+
+            st.button("🧹 Clear All Filters", key="clear_filters", use_container_width=True,
+                      help="Reset all filters to their default state", on_click=clear_filters)
             # Replace the checkbox sections in your code with these versions:
             # MAIN CATEGORY FILTER
             st.markdown("<div class='filter-section'>", unsafe_allow_html=True)
             st.markdown("<div class='filter-header'>Main Categories</div>", unsafe_allow_html=True)
-            main_categories = sorted(items_df['Main Category'].dropna().unique().tolist())
+            main_categories = category_tree.main_categories
             
             def update_main_category(category):
                 if category not in st.session_state.wizard_filters['main_categories']:
@@ -175,7 +147,7 @@ def show_item_wizard(items_df, add_callback):
             
             for category in main_categories:
                 st.checkbox(
-                    category,
+                    f"{category} ({category_tree.main_counts[category]})",
                     key=f"main_{category}",
                     value=category in st.session_state.wizard_filters['main_categories'],
                     on_change=update_main_category,
@@ -195,24 +167,11 @@ def show_item_wizard(items_df, add_callback):
                     st.session_state.wizard_filters['sub1_categories'].remove(sub1)
                 st.session_state.current_page = 1
             
-            if st.session_state.wizard_filters['main_categories']:
-                sub1_options = items_df[
-                    items_df['Main Category'].isin(st.session_state.wizard_filters['main_categories'])
-                ]['Sub Category 1'].dropna().unique().tolist()
-            else:
-                sub1_options = items_df['Sub Category 1'].dropna().unique().tolist()
+            # Already sorted by numeric prefix, with item counts for the selected mains
+            sub1_options = category_tree.sub1_options(st.session_state.wizard_filters['main_categories'])
             
-            import re
-
-            def extract_prefix_number(s):
-                match = re.match(r"^\s*(\d+)\.", s)
-                return int(match.group(1)) if match else float('inf')  # Non-numbered items go last
-            
-            # Sort using the numeric prefix
-            sorted_sub1 = sorted(sub1_options, key=extract_prefix_number)
-            
-            for sub1 in sorted_sub1:
-                label = f"{sub1}".replace(" ", "\u00A0")  # Preserve spacing in UI
+            for sub1, count in sub1_options:
+                label = f"{sub1} ({count})".replace(" ", "\u00A0")  # Preserve spacing in UI
                 st.checkbox(
                     label,
                     key=f"sub1_{sub1}",
@@ -234,23 +193,15 @@ def show_item_wizard(items_df, add_callback):
                     st.session_state.wizard_filters['sub2_categories'].remove(sub2)
                 st.session_state.current_page = 1
             
-            # Create a base query for Sub Category 2 filtering
-            base_query = items_df.copy()
-            
-            # Apply Main Category filter if any are selected
-            if st.session_state.wizard_filters['main_categories']:
-                base_query = base_query[base_query['Main Category'].isin(st.session_state.wizard_filters['main_categories'])]
-            
-            # Apply Sub Category 1 filter if any are selected
-            if st.session_state.wizard_filters['sub1_categories']:
-                base_query = base_query[base_query['Sub Category 1'].isin(st.session_state.wizard_filters['sub1_categories'])]
-            
-            # Get the filtered Sub Category 2 options
-            sub2_options = base_query['Sub Category 2'].dropna().unique().tolist()
+            # Sub Category 2 options (and counts) under the selected mains and sub1s
+            sub2_options = category_tree.sub2_options(
+                st.session_state.wizard_filters['main_categories'],
+                st.session_state.wizard_filters['sub1_categories']
+            )
             
-            for sub2 in sorted(sub2_options):
+            for sub2, count in sub2_options:
                 st.checkbox(
-                    sub2,
+                    f"{sub2} ({count})",
                     key=f"sub2_{sub2}",
                     value=sub2 in st.session_state.wizard_filters['sub2_categories'],
                     on_change=update_sub2_category,
@@ -260,75 +211,55 @@ def show_item_wizard(items_df, add_callback):
 
         # ITEMS COLUMN
         with items_col:
-            # Apply filters
-            filtered_items = items_df.copy()
-            
-            # Category filters
-            if st.session_state.wizard_filters['main_categories']:
-                filtered_items = filtered_items[
-                    filtered_items['Main Category'].isin(st.session_state.wizard_filters['main_categories'])
-                ]
-            if st.session_state.wizard_filters['sub1_categories']:
-                filtered_items = filtered_items[
-                    filtered_items['Sub Category 1'].isin(st.session_state.wizard_filters['sub1_categories'])
-                ]
-            if st.session_state.wizard_filters['sub2_categories']:
-                filtered_items = filtered_items[
-                    filtered_items['Sub Category 2'].isin(st.session_state.wizard_filters['sub2_categories'])
-                ]
+            # Apply filters (as row positions into items_df, in catalog order)
+            filtered_positions = category_tree.filter_positions(
+                st.session_state.wizard_filters['main_categories'],
+                st.session_state.wizard_filters['sub1_categories'],
+                st.session_state.wizard_filters['sub2_categories']
+            )
+            if filtered_positions is None:
+                filtered_positions = np.arange(len(items_df))
             
-            # Search filter
+            # Search filter - all terms must appear, in any order (posting-list intersection)
             if search_term:
-                search_terms = search_term.lower().split()
-                
-                def search_match(row):
-                    # Combine all relevant fields into one searchable string
-                    search_text = ' '.join([
-                        str(row['Item Name']).lower(),
-                        str(row['Main Category']).lower(),
-                        str(row['Sub Category 1']).lower(),
-                        str(row['Sub Category 2']).lower()
-                    ])
-                    
-                    # Check if all search terms appear in any order
-                    return all(term in search_text for term in search_terms)
-                
-                filtered_items = filtered_items[filtered_items.apply(search_match, axis=1)]
+                search_positions = catalog.search_index.search(search_term)
+                if search_positions is not None:
+                    filtered_positions = np.intersect1d(filtered_positions, search_positions, assume_unique=True)
             
             # PAGINATION CONTROLS
             PAGE_SIZE = 50
-            total_items = len(filtered_items)
+            total_items = len(filtered_positions)
             total_pages = max(1, (total_items // PAGE_SIZE) + (1 if total_items % PAGE_SIZE else 0))
             
             # Initialize current page in session state if not exists
             if 'current_page' not in st.session_state:
                 st.session_state.current_page = 1
             
-            # Navigation buttons
+            # Navigation buttons (page flips are callbacks: one rerun of the wizard, nothing else)
+            def go_to_page(page):
+                st.session_state.current_page = page
+
             if total_pages > 1:
                 col1, col2, col3, col4, _ = st.columns([1, 1, 1, 1, 6])
                 
                 with col1:
-                    if st.button("⏮️", disabled=st.session_state.current_page == 1, 
-                               key="first_page", help="Go to first page"):
-                        st.session_state.current_page = 1
-                        st.rerun()
+                    st.button("⏮️", disabled=st.session_state.current_page == 1, 
+                              key="first_page", help="Go to first page",
+                              on_click=go_to_page, args=(1,))
                 
                 with col2:
-                    if st.button("◀️", disabled=st.session_state.current_page == 1, 
-                               key="prev_page", help="Previous page"):
-                        st.session_state.current_page -= 1
-                        st.rerun()
+                    st.button("◀️", disabled=st.session_state.current_page == 1, 
+                              key="prev_page", help="Previous page",
+                              on_click=go_to_page, args=(st.session_state.current_page - 1,))
                 
                 with col3:
                     st.markdown(f"<div class='pagination-info'>Page {st.session_state.current_page} of {total_pages}</div>", 
                                unsafe_allow_html=True)
                 
                 with col4:
-                    if st.button("▶️", disabled=st.session_state.current_page == total_pages, 
-                               key="next_page", help="Next page"):
-                        st.session_state.current_page += 1
-                        st.rerun()
+                    st.button("▶️", disabled=st.session_state.current_page == total_pages, 
+                              key="next_page", help="Next page",
+                              on_click=go_to_page, args=(st.session_state.current_page + 1,))
             
             # Calculate which items to show
             start_idx = (st.session_state.current_page - 1) * PAGE_SIZE
@@ -339,79 +270,27 @@ def show_item_wizard(items_df, add_callback):
                 f"<div class='results-count'>Showing items {start_idx + 1}-{end_idx} of {total_items}</div>", 
                 unsafe_allow_html=True
             )
-            def copy_buttons(item_name, unit_price, item_unit):
-                # Prepare the texts
-                text1 = item_name
-                text2 = f"{item_name}\t{unit_price}\t{item_unit}"
-            
-                # Escape quotes
-                escaped_text1 = text1.replace('"', '\\"').replace("'", "\\'")
-                escaped_text2 = text2.replace('"', '\\"').replace("'", "\\'")
-            
-                # Inject both buttons in a flex container
-                st.components.v1.html(f"""
-                    <style>
-                    .copy-btn {{
-                        background-color: #f0f2f6;
-                        border: none;
-                        color: #262730;
-                        padding: 0.5rem 1rem;
-                        margin-top: 0.25rem;
-                        margin-bottom: 0.25rem;
-                        border-radius: 0.5rem;
-                        font-size: 0.875rem;
-                        cursor: pointer;
-                        width: 100%;
-                        text-align: center;
-                        transition: background-color 0.2s ease;
-                    }}
-                    .copy-btn:hover {{
-                        background-color: #e4e8ef;
-                    }}
-                    </style>
-                    <script>
-                    function copyToClipboard(text) {{
-                        navigator.clipboard.writeText(text);
-                    }}
-                    </script>
-                    <div style="display: flex; gap: 8px; margin-top: 5px;">
-                        <button onclick='copyToClipboard("{escaped_text1}")'
-                                class="copy-btn"
-                                title="Copy Item Name">⧉ Copy Item Name</button>
-                        <button onclick='copyToClipboard("{escaped_text2}")'
-                                class="copy-btn"
-                                title="Copy All Details">📋 Copy Item Details</button>
-                    </div>
-                """, height=50)
-            # DISPLAY ITEMS
-            for idx in range(start_idx, end_idx):
-                row = filtered_items.iloc[idx]
-                col1, col2 = st.columns([5, 1])
-                with col1:
-                    st.markdown(f"""
-                        <div class='item-card'>
-                            <div class='item-title-container'>
-                                <div class='item-title'>{row['Item Name']}</div>
-                            </div>
-                            <div class='item-categories'>
-                                {row['Main Category']} » {row['Sub Category 1']} » {row['Sub Category 2']}
-                            </div>
-                            <div class='item-price'>
-                                ₹{row['Unit Price']:.2f} per {row['Item Unit']}
-                            </div>
-                        </div>
-                        <script>
-                        function copyToClipboard(text) {{
-                            navigator.clipboard.writeText(text);
-                            return false;
-                        }}
-                        </script>
-                    """, unsafe_allow_html=True)
-                    copy_buttons(row['Item Name'], row['Unit Price'], row['Item Unit'])
-                with col2:
-                    if st.button("Add", key=f"add_{idx}"):
-                        add_callback(row['Item Name'])
-                        st.rerun()
+            # DISPLAY ITEMS (the whole page goes to one component frame)
+            page = items_df.iloc[filtered_positions[start_idx:end_idx]]
+            cards = [
+                {
+                    'name': str(name),
+                    'categories': f"{main} » {sub1} » {sub2}",
+                    'price': f"₹{price:.2f} per {unit}",
+                    'details': f"{name}\t{price}\t{unit}",
+                }
+                for name, main, sub1, sub2, price, unit in zip(
+                    page['Item Name'], page['Main Category'], page['Sub Category 1'],
+                    page['Sub Category 2'], page['Unit Price'], page['Item Unit']
+                )
+            ]
+            choice = _item_cards(cards=cards, key="wizard_cards", default=None)
+
+            # The component keeps its last value across reruns, so act on each click once
+            if choice and choice.get('nonce') != st.session_state.get('wizard_cards_nonce'):
+                st.session_state.wizard_cards_nonce = choice.get('nonce')
+                add_callback(choice['name'])
+                st.rerun()
 
         st.markdown("</div>", unsafe_allow_html=True)  # Close wizard-container
 
@@ -428,10 +307,10 @@ if __name__ == "__main__":
         st.session_state.selected_items.append(item_name)
     
     # Load the data
-    items_data = load_item_data()
+    items_catalog = load_item_catalog()
     
     # Show the wizard
-    show_item_wizard(items_data, handle_add_item)
+    show_item_wizard(items_catalog, handle_add_item)
     
     # Display selected items (for demo purposes)
     if 'selected_items' in st.session_state and st.session_state.selected_items:
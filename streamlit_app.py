@@ -1,24 +1,31 @@
 import pandas as pd
 import streamlit as st
-from fpdf import FPDF
 import math
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Border, Side
+import os
+import time
+import functools
 from item_wizard import show_item_wizard
+from grid_editor import show_grid_editor
+from catalog import get_catalog, get_templates
+from workbook_cache import read_workbook
+from upload_parser import UploadCache, UploadFormatError
+from estimate import Estimate, LineItem, OTHER, to_paise, format_money
+from exports import ExportCache, export_key, EXCEL_MIME, PDF_MIME
+from export_jobs import ExportPool, ExportQueueFull, QUEUED, RUNNING, DONE, FAILED
 import base64
-from decimal import Decimal, ROUND_HALF_UP, getcontext
-
-
-getcontext().prec = 10  # Increase precision
 
 
 # Set page config
 st.set_page_config(layout="wide")
+page_started = time.perf_counter()
+
+# Show the per-fragment render timings in the sidebar (RENDER_TIMINGS=1)
+SHOW_RENDER_TIMINGS = os.environ.get("RENDER_TIMINGS") == "1"
 
 # Load user credentials from Sheet 2 of Excel
 @st.cache_data
 def load_credentials(file_path):
-    return pd.read_excel(file_path, sheet_name=1)  # Sheet 2 is index 1
+    return read_workbook(file_path, sheet_name=1)  # Sheet 2 is index 1
 
 def toggle_section(section_key):
     """Toggle a section and properly collapse all others"""
@@ -53,35 +60,108 @@ def authenticate(username, password, credentials_df):
         return user_row.iloc[0]['password'] == password
     return False
 
-# Load main items data
-@st.cache_data
-def load_main_items(username):
+# Load main items data (one shared catalog: names, rates, wizard frame and indexes)
+def load_catalog(username):
     try:
-        data = pd.read_excel("items.xltm", sheet_name=username)
-        return data['Item Name'].tolist(), data['Unit Price'].tolist(), data['Item Unit'].tolist(), data
+        return get_catalog(username)
     except Exception as e:
         st.error(f"Error loading main items data for {username}: {str(e)}")
         st.stop()
         
 # Add this with the other data loading functions
-@st.cache_data
-def load_templates():
+def load_templates(catalog):
     try:
-        template_data = pd.read_excel("Templates.xlsx", sheet_name=None)
-        return template_data
+        # Resolved against the user's rates once and cached (see catalog.get_templates)
+        return get_templates(catalog)
     except Exception as e:
         st.error(f"Error loading template data: {str(e)}")
         st.stop()
         
-# Load wizard items data
-@st.cache_data
-def load_wizard_items(username):
+# Generated Excel/PDF files by content hash, shared by all sessions
+@st.cache_resource
+def get_export_cache():
+    return ExportCache()
+
+# Background export workers, shared by all sessions (size/queue: see export_jobs)
+@st.cache_resource
+def get_export_pool():
+    return ExportPool(get_export_cache())
+
+def start_export(kind, submit):
+    """Queue an export and remember its job for this session"""
     try:
-        wizard_data = pd.read_excel("items.xltm", sheet_name=username)
-        return wizard_data
-    except Exception as e:
-        st.error(f"Error loading wizard items data for {username}: {str(e)}")
-        st.stop()
+        job = submit(get_export_pool())
+    except ExportQueueFull as e:
+        st.warning(str(e))
+        return
+    st.session_state.export_jobs[kind] = job.id
+
+def show_export(kind, key, label, file_name, mime):
+    """Progress of this session's export of `kind`, then its download button"""
+    job_id = st.session_state.export_jobs.get(kind)
+    if job_id is None:
+        return
+    pool = get_export_pool()
+    job = pool.job(job_id)
+    if job is not None and job.key != key:
+        # The estimate (or heading) changed since; that file is out of date
+        del st.session_state.export_jobs[kind]
+        return
+    polling = job is not None and not job.finished
+
+    # Only re-run this small part of the page while the file is being built
+    @st.fragment(run_every=1 if polling else None)
+    def export_status():
+        job = pool.job(job_id)
+        data = pool.result(job) if job is not None and job.status == DONE else None
+        if job is None or (job.status == DONE and data is None):
+            st.caption("This export has expired, please generate it again")
+        elif job.status == QUEUED:
+            st.progress(0.0, text=f"Waiting for a free export worker ({pool.pending()} in progress)...")
+        elif job.status == RUNNING:
+            st.progress(job.progress, text=f"Building {file_name}... {job.progress:.0%}")
+        elif job.status == FAILED:
+            st.error(f"Error generating {file_name}: {job.error}")
+        else:
+            st.download_button(label, data, file_name=file_name, mime=mime, key=f"download_{kind}")
+        if polling and (job is None or job.finished):
+            st.rerun()  # Stop polling
+
+    export_status()
+
+def record_timing(name, started):
+    """Keep the last run time (ms) and run count of a page part for this session"""
+    timings = st.session_state.setdefault('render_timings', {})
+    runs = timings.get(name, (0.0, 0))[1]
+    timings[name] = ((time.perf_counter() - started) * 1000, runs + 1)
+
+def timed_fragment(name):
+    """st.fragment that also records its run time under `name`"""
+    def decorate(func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            func(*args, **kwargs)
+            record_timing(name, started)
+        return st.fragment(timed)
+    return decorate
+
+def show_render_timings():
+    # Every full page run also runs each visible fragment once, so a fragment with
+    # more runs than "Full page" has been rerunning on its own
+    timings = st.session_state.get('render_timings')
+    if not SHOW_RENDER_TIMINGS or not timings:
+        return
+    with st.sidebar.expander("⏱️ Render timings"):
+        st.dataframe(
+            pd.DataFrame([{"Part": name, "Last run (ms)": round(ms, 1), "Runs": runs}
+                          for name, (ms, runs) in timings.items()]),
+            hide_index=True
+        )
+        if st.session_state.get('authenticated'):
+            # Cached lookup, and the shared catalog is what most of the process memory goes to
+            catalog = get_catalog(st.session_state.logged_in_username)
+            st.caption(f"Rate catalog ({len(catalog)} items): {catalog.memory_usage() / 2**20:.1f} MB")
 
 # Login screen
 import streamlit as st
@@ -127,8 +207,8 @@ def login_page(credentials_df):
 def main_app():
     # Load data
     username = st.session_state.logged_in_username
-    item_names, unit_prices, item_units, data = load_main_items(username)
-    wizard_data = load_wizard_items(username)
+    catalog = load_catalog(username)  # Shared catalog with the name -> row index
+    item_names = catalog.item_names
     
     # UI for Estimate Drafting with updated styles
     st.markdown("<h1 style='text-align: center; color: #154c79;'>ESTIMATE DRAFTER</h1>", unsafe_allow_html=True)
@@ -194,8 +274,10 @@ def main_app():
     st.markdown("<h3 style='text-align: center; color: #76b5c5; font-size: 125%;'>ADD ITEMS TO ESTIMATE</h3>", unsafe_allow_html=True)
 
     # Initialize session state
-    if 'selected_items' not in st.session_state:
-        st.session_state.selected_items = []
+    if 'estimate' not in st.session_state:
+        # Line items plus running totals, kept in step by every edit below
+        st.session_state.estimate = Estimate()
+    estimate = st.session_state.estimate
     if 'item_count' not in st.session_state:
         st.session_state.item_count = 0
     if 'adding_subheading' not in st.session_state:
@@ -212,6 +294,12 @@ def main_app():
         st.session_state.show_templates = False    
     if 'show_upload' not in st.session_state:
         st.session_state.show_upload = False
+    if 'upload_cache' not in st.session_state:
+        # Parsed uploads by content hash, so reruns don't re-read the workbook
+        st.session_state.upload_cache = UploadCache()
+    if 'export_jobs' not in st.session_state:
+        # Background export job ids by kind ('xlsx', 'pdf')
+        st.session_state.export_jobs = {}
     # Add this with your other session state initializations
     if 'show_preview' not in st.session_state:
         st.session_state.show_preview = False
@@ -220,289 +308,240 @@ def main_app():
         st.session_state.item_count += 1
 
     def remove_item(index):
-        st.session_state.selected_items.pop(index)
+        estimate.pop(index)
         st.session_state.item_count = max(0, st.session_state.item_count - 1)
         st.rerun()
 
     def calculate_totals():
-        """
-        Ensures the final total (total_cost + gst + unforeseen) is a multiple of 1000
-        by adjusting unforeseen <= ₹10,000 downward.
-        """
-        selected_items = st.session_state.selected_items
-    
-        total_cost = sum(
-            Decimal(str(item['Cost']))
-            for item in selected_items
-            if item.get('Type') != 'Subheading'
-        )
-    
-        taxable_amount = sum(
-            Decimal(str(item['Cost']))
-            for item in selected_items
-            if item.get('Type') != 'Subheading' and item.get('GST_Applicable', True)
-        )
-    
-        gst = (taxable_amount * Decimal('0.18')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    
-        # Base unforeseen = 1% of total cost, capped at ₹10,000
-        base_unforeseen = min((total_cost * Decimal('0.01')).quantize(Decimal('0.01')), Decimal('10000.00'))
-    
-        # Adjust unforeseen downward to make final_total a multiple of 1000
-        step = Decimal('0.01')
-        unforeseen = base_unforeseen
-        while unforeseen >= Decimal('0.00'):
-            final_total = total_cost + gst + unforeseen
-            if final_total % 1000 == 0:
-                break
-            unforeseen -= step
-    
-        # Fallback (should not happen)
-        if unforeseen < 0:
-            unforeseen = Decimal('0.00')
-            final_total = (total_cost + gst + unforeseen).quantize(Decimal('0.01'))
-    
-        return float(total_cost), float(gst), float(unforeseen), float(final_total)
+        return estimate.totals()
     
     def move_item_up(index):
         if index > 0:
-            st.session_state.selected_items[index], st.session_state.selected_items[index - 1] = \
-                st.session_state.selected_items[index - 1], st.session_state.selected_items[index]
+            estimate.swap(index, index - 1)
             st.rerun()
     
     def move_item_down(index):
-        if index < len(st.session_state.selected_items) - 1:
-            st.session_state.selected_items[index], st.session_state.selected_items[index + 1] = \
-                st.session_state.selected_items[index + 1], st.session_state.selected_items[index]
+        if index < len(estimate) - 1:
+            estimate.swap(index, index + 1)
             st.rerun()
 
+    def toggle_preview():
+        st.session_state.show_preview = not st.session_state.get('show_preview', False)
+
     def handle_item_selection(selected_item):
-        # Find the item in wizard data first
-        wizard_item = wizard_data[wizard_data['Item Name'] == selected_item].iloc[0]
-        
-        # Try to find matching item in main data for unit price and unit
-        main_item = data[data['Item Name'] == selected_item]
-        
-        if not main_item.empty:
-            main_item = main_item.iloc[0]
-            unit_price = main_item['Unit Price']
-            unit = main_item['Item Unit']
-        else:
-            # Use wizard data if not found in main data
-            unit_price = wizard_item['Unit Price']
-            unit = wizard_item['Item Unit']
-        
-        st.session_state.selected_items.append({
-            'Item': selected_item,
-            'Quantity': 1.0,
-            'Unit Price': unit_price,
-            'Item Unit': unit,
-            'Cost': unit_price,
-            'Type': 'Standard',
-            'GST_Applicable': True,
-            'Quantity_Remarks': ""
-        })
+        # Wizard and main data share one catalog, so a single index lookup is enough
+        estimate.append(catalog.line_item(selected_item, 1.0))
         st.session_state.show_wizard = False
         st.success(f"Item '{selected_item}' added successfully!")
         st.rerun()
 
-    # Display added items and subheadings
-    for idx, item in enumerate(st.session_state.selected_items):
-        if item.get('Type') == 'Subheading':
-            # Modified expander with controlled state
-            expanded = st.session_state.get(f"expander_{idx}", False)
-            with st.expander(f"📌 {item['Item']}", expanded=expanded):
-                # Editable text input for subheading
-                new_heading = st.text_input("Edit Subheading", value=item['Item'], key=f"edit_subheading_{idx}")
+    # Names from the last template/upload that weren't in the rate list (shown once)
+    insert_report = st.session_state.pop('insert_report', None)
+    if insert_report and insert_report[1]:
+        source, unmatched = insert_report
+        st.warning(f"{len(unmatched)} item(s) from the {source} were not found in the rate list "
+                   "and were added as Other items:")
+        st.dataframe(pd.DataFrame(unmatched), hide_index=True)
+
+    # Estimate list: typing in a line or opening its remark box only reruns the list;
+    # edits to the estimate itself call st.rerun() so totals and exports follow
+    @timed_fragment("Estimate list")
+    def estimate_list():
+        # Display added items and subheadings
+        for idx, item in enumerate(estimate):
+            if item.is_subheading:
+                # Modified expander with controlled state
+                expanded = st.session_state.get(f"expander_{idx}", False)
+                with st.expander(f"📌 {item.name}", expanded=expanded):
+                    # Editable text input for subheading
+                    new_heading = st.text_input("Edit Subheading", value=item.name, key=f"edit_subheading_{idx}")
         
-                # Update and Remove buttons
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 6])
-                with col1:
-                    if st.button("🔁 Update", key=f"update_sub_{idx}"):
-                        if new_heading.strip():
-                            st.session_state.selected_items[idx]['Item'] = new_heading.strip()
-                            st.session_state[f"expander_{idx}"] = False  # Collapse the expander
-                            st.success("Subheading updated successfully!")
-                            st.rerun()
-                with col2:
-                    if st.button(f"❌ Remove", key=f"remove_sub_{idx}"):
-                        remove_item(idx)
-                with col3:    
-                    if st.button("⬆️ Move Up", key=f"move_up_sub_{idx}"):
-                        move_item_up(idx)
-                with col4:
-                    if st.button("⬇️ Move Down", key=f"move_down_sub_{idx}"):
-                        move_item_down(idx)
-            continue
+                    # Update and Remove buttons
+                    col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 6])
+                    with col1:
+                        if st.button("🔁 Update", key=f"update_sub_{idx}"):
+                            if new_heading.strip():
+                                estimate.replace(idx, LineItem.subheading(new_heading.strip()))
+                                st.session_state[f"expander_{idx}"] = False  # Collapse the expander
+                                st.success("Subheading updated successfully!")
+                                st.rerun()
+                    with col2:
+                        if st.button(f"❌ Remove", key=f"remove_sub_{idx}"):
+                            remove_item(idx)
+                    with col3:    
+                        if st.button("⬆️ Move Up", key=f"move_up_sub_{idx}"):
+                            move_item_up(idx)
+                    with col4:
+                        if st.button("⬇️ Move Down", key=f"move_down_sub_{idx}"):
+                            move_item_down(idx)
+                continue
 
 
-        item_type = item.get('Type', 'Standard')
-        item_title = f"💧 Item {idx + 1}: {item['Item']} (₹{item['Cost']:.2f})"
-        if item_type == 'Other':
-            item_title += " [Other" + (" +GST" if item.get('GST_Applicable', False) else "") + "]"
+            item_type = item.item_type
+            item_title = f"💧 Item {idx + 1}: {item.name} (₹{format_money(item.cost, grouping=False)})"
+            if item_type == OTHER:
+                item_title += " [Other" + (" +GST" if item.gst_applicable else "") + "]"
         
-        # Modified expander with controlled state
-        expanded = st.session_state.get(f"expander_{idx}", False)
-        with st.expander(item_title, expanded=expanded):
+            # Modified expander with controlled state
+            expanded = st.session_state.get(f"expander_{idx}", False)
+            with st.expander(item_title, expanded=expanded):
                     
-            if item_type == 'Other':
-                # Enhanced display for "Other" type items with editing capability
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    # Editable item description
-                    new_desc = st.text_input(
-                        "Item Description", 
-                        value=item['Item'],
-                        key=f"other_desc_{idx}"
-                    )
-                with col2:
-                    # Editable total price
-                    new_price = st.text_input(
-                        "Total Price", 
-                        value=f"{item['Cost']:.2f}",
-                        key=f"other_price_{idx}"
-                    )
-                    # Editable GST checkbox
-                    new_gst = st.checkbox(
-                        "GST Applicable?", 
-                        value=item.get('GST_Applicable', False),
-                        key=f"other_gst_{idx}"
-                    )
-                    # Remark Section for 'Other' Items
-                    remark = item.get('Quantity_Remarks', '')
-                    button_label = "✏️ Edit Remark" if remark else "➕ Add Remark"
+                if item_type == OTHER:
+                    # Enhanced display for "Other" type items with editing capability
+                    col1, col2 = st.columns([3, 1])
+                    with col1:
+                        # Editable item description
+                        new_desc = st.text_input(
+                            "Item Description", 
+                            value=item.name,
+                            key=f"other_desc_{idx}"
+                        )
+                    with col2:
+                        # Editable total price
+                        new_price = st.text_input(
+                            "Total Price", 
+                            value=format_money(item.cost, grouping=False),
+                            key=f"other_price_{idx}"
+                        )
+                        # Editable GST checkbox
+                        new_gst = st.checkbox(
+                            "GST Applicable?", 
+                            value=item.gst_applicable,
+                            key=f"other_gst_{idx}"
+                        )
+                        # Remark Section for 'Other' Items
+                        remark = item.remarks
+                        button_label = "✏️ Edit Remark" if remark else "➕ Add Remark"
                     
-                    if st.button(button_label, key=f"edit_remark_other_{idx}"):
-                        st.session_state.selected_items[idx]['show_remark_input'] = True
+                        if st.button(button_label, key=f"edit_remark_other_{idx}"):
+                            st.session_state[f"remark_open_{idx}"] = True
                     
-                    if remark and not item.get('show_remark_input', False):
-                        st.info(f"📋 Quantity Remark: {remark}")
+                        if remark and not st.session_state.get(f"remark_open_{idx}", False):
+                            st.info(f"📋 Quantity Remark: {remark}")
                     
-                    if item.get('show_remark_input', False):
-                        new_remark = st.text_input("Edit Remark", value=remark, key=f"remark_input_other_{idx}", max_chars=100)
-                        if st.button("Save Remark", key=f"save_remark_other_{idx}"):
-                            st.session_state.selected_items[idx]['Quantity_Remarks'] = new_remark
-                            st.session_state.selected_items[idx]['show_remark_input'] = False
-                            st.rerun()
+                        if st.session_state.get(f"remark_open_{idx}", False):
+                            new_remark = st.text_input("Edit Remark", value=remark, key=f"remark_input_other_{idx}", max_chars=100)
+                            if st.button("Save Remark", key=f"save_remark_other_{idx}"):
+                                estimate.set_remarks(idx, new_remark)
+                                st.session_state[f"remark_open_{idx}"] = False
+                                st.rerun()
 
                     
-                # Action buttons
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 6])
-                with col1:
-                    if st.button(f"🔁 Update", key=f"update_other_{idx}"):
-                        if new_desc and new_price:
-                            try:
-                                price = float(new_price)
-                                if price > 0:
-                                    st.session_state.selected_items[idx] = {
-                                        'Item': new_desc,
-                                        'Cost': price,
-                                        'Type': 'Other',
-                                        'GST_Applicable': new_gst,
-                                        'Quantity_Remarks': item.get('Quantity_Remarks', ''),
-                                        'show_remark_input': False  # Add this line
-                                    }
-                                    st.session_state[f"expander_{idx}"] = False  # Add this line to collapse
-                                    st.success("Custom item updated successfully!")
-                                    st.rerun()
-                            except ValueError:
-                                st.error("Please enter a valid price")
-                with col2:
-                    if st.button(f"❌ Remove", key=f"remove_{idx}"):
-                        remove_item(idx)
+                    # Action buttons
+                    col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 6])
+                    with col1:
+                        if st.button(f"🔁 Update", key=f"update_other_{idx}"):
+                            if new_desc and new_price:
+                                try:
+                                    price = to_paise(new_price)
+                                    if price > 0:
+                                        estimate.replace(idx, LineItem.other(new_desc, price, new_gst, item.remarks))
+                                        st.session_state[f"remark_open_{idx}"] = False
+                                        st.session_state[f"expander_{idx}"] = False  # Add this line to collapse
+                                        st.success("Custom item updated successfully!")
+                                        st.rerun()
+                                except ValueError:
+                                    st.error("Please enter a valid price")
+                    with col2:
+                        if st.button(f"❌ Remove", key=f"remove_{idx}"):
+                            remove_item(idx)
                         
-                with col3:
-                    if st.button("⬆️ Move Up", key=f"move_up_sub_{idx}"):
-                        move_item_up(idx)
-                with col4:
-                    if st.button("⬇️ Move Down", key=f"move_down_sub_{idx}"):
-                        move_item_down(idx)
-            else:
-                # Display for standard items
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    item_name = st.selectbox(
-                        "Select Item", 
-                        [''] + item_names, 
-                        index=item_names.index(item['Item']) + 1 if item['Item'] in item_names else 0, 
-                        key=f"edit_item_{idx}"
-                    )
-                    st.text(f"Item Description: {item_name}" if item_name else "")
-                with col2:
-                    quantity = st.text_input(
-                        "Quantity", 
-                        str(item['Quantity']), 
-                        key=f"edit_qty_{idx}", 
-                        placeholder="Input Quantity"
-                    )
-                    gst_applicable = st.checkbox(
-                        "GST Applicable?", 
-                        value=item.get('GST_Applicable', True), 
-                        key=f"edit_standard_gst_{idx}"
-                    )
+                    with col3:
+                        if st.button("⬆️ Move Up", key=f"move_up_sub_{idx}"):
+                            move_item_up(idx)
+                    with col4:
+                        if st.button("⬇️ Move Down", key=f"move_down_sub_{idx}"):
+                            move_item_down(idx)
+                else:
+                    # Display for standard items
+                    col1, col2 = st.columns([3, 1])
+                    with col1:
+                        item_name = st.selectbox(
+                            "Select Item", 
+                            ('',) + item_names, 
+                            index=catalog.position(item.name) + 1 if catalog.position(item.name) is not None else 0, 
+                            key=f"edit_item_{idx}"
+                        )
+                        st.text(f"Item Description: {item_name}" if item_name else "")
+                    with col2:
+                        quantity = st.text_input(
+                            "Quantity", 
+                            str(item.quantity), 
+                            key=f"edit_qty_{idx}", 
+                            placeholder="Input Quantity"
+                        )
+                        gst_applicable = st.checkbox(
+                            "GST Applicable?", 
+                            value=item.gst_applicable, 
+                            key=f"edit_standard_gst_{idx}"
+                        )
                     
-                    # Show unit rate below quantity
-                    st.markdown(f"**Rate:** ₹{item['Unit Price']:.2f} per {item['Item Unit']}")
-                    # Quantity Remarks section (for standard items)
+                        # Show unit rate below quantity
+                        st.markdown(f"**Rate:** ₹{format_money(item.unit_price, grouping=False)} per {item.unit}")
+                        # Quantity Remarks section (for standard items)
 
-                    # Check if a remark already exists
-                    remark = item.get('Quantity_Remarks', '')
+                        # Check if a remark already exists
+                        remark = item.remarks
                     
-                    # Change button label based on whether remark exists
-                    button_label = "✏️ Edit Remark" if remark else "➕ Add Remark"                    
-                    if st.button(button_label, key=f"add_qty_remark_{idx}"):
-                        st.session_state.selected_items[idx]['show_remark_input'] = True
+                        # Change button label based on whether remark exists
+                        button_label = "✏️ Edit Remark" if remark else "➕ Add Remark"                    
+                        if st.button(button_label, key=f"add_qty_remark_{idx}"):
+                            st.session_state[f"remark_open_{idx}"] = True
                     
-                    # Show saved remark always (read-only view)
-                    if remark and not item.get('show_remark_input', False):
-                        st.info(f"📋 Quantity Remark: {remark}")
+                        # Show saved remark always (read-only view)
+                        if remark and not st.session_state.get(f"remark_open_{idx}", False):
+                            st.info(f"📋 Quantity Remark: {remark}")
                     
-                    # Show input box if editing
-                    if item.get('show_remark_input', False):
-                        new_remark = st.text_input("Edit Remark", value=remark, key=f"qty_remark_{idx}", max_chars=100)
-                        if st.button("Save Remark", key=f"save_remark_{idx}"):
-                            st.session_state.selected_items[idx]['Quantity_Remarks'] = new_remark
-                            st.session_state.selected_items[idx]['show_remark_input'] = False
-                            st.session_state[f"expander_{idx}"] = False  # Collapse after saving remark
-                            st.rerun()
+                        # Show input box if editing
+                        if st.session_state.get(f"remark_open_{idx}", False):
+                            new_remark = st.text_input("Edit Remark", value=remark, key=f"qty_remark_{idx}", max_chars=100)
+                            if st.button("Save Remark", key=f"save_remark_{idx}"):
+                                estimate.set_remarks(idx, new_remark)
+                                st.session_state[f"remark_open_{idx}"] = False
+                                st.session_state[f"expander_{idx}"] = False  # Collapse after saving remark
+                                st.rerun()
 
-                # Action buttons inside expander
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 6])
-                with col1:
-                    if st.button(f"🔁 Update", key=f"update_{idx}"):
-                        if item_name and quantity:
-                            try:
-                                quantity = float(quantity)
-                                if quantity > 0:
-                                    item_data = data[data['Item Name'] == item_name].iloc[0]
-                                    unit_price = item_data['Unit Price']
-                                    unit = item_data['Item Unit']
-                                    cost = round(quantity * unit_price, 2)
-                                    st.session_state.selected_items[idx] = {
-                                        'Item': item_name,
-                                        'Quantity': quantity,
-                                        'Unit Price': unit_price,
-                                        'Item Unit': unit,
-                                        'Cost': cost,
-                                        'Type': 'Standard',
-                                        'GST_Applicable': gst_applicable,
-                                        'Quantity_Remarks': item.get('Quantity_Remarks', ''),  # Preserve existing remarks
-                                        'show_remark_input': False  # Add this line
-                                    }
-                                    st.session_state[f"expander_{idx}"] = False  # Add this line to collapse
-                                    st.success("Item updated successfully!")
-                                    st.rerun()
-                            except ValueError:
-                                st.error("Please enter a valid quantity")
-                with col2:
-                    if st.button(f"❌ Remove", key=f"remove_{idx}"):
-                        remove_item(idx)
-                with col3:
-                    if st.button("⬆️ Move Up", key=f"move_up_sub_{idx}"):
-                        move_item_up(idx)
-                with col4:
-                    if st.button("⬇️ Move Down", key=f"move_down_sub_{idx}"):
-                        move_item_down(idx)
+                    # Action buttons inside expander
+                    col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 6])
+                    with col1:
+                        if st.button(f"🔁 Update", key=f"update_{idx}"):
+                            if item_name and quantity:
+                                try:
+                                    quantity = float(quantity)
+                                    if quantity > 0:
+                                        estimate.replace(idx, catalog.line_item(
+                                            item_name, quantity,
+                                            gst_applicable=gst_applicable,
+                                            remarks=item.remarks  # Preserve existing remarks
+                                        ))
+                                        st.session_state[f"remark_open_{idx}"] = False
+                                        st.session_state[f"expander_{idx}"] = False  # Add this line to collapse
+                                        st.success("Item updated successfully!")
+                                        st.rerun()
+                                except ValueError:
+                                    st.error("Please enter a valid quantity")
+                    with col2:
+                        if st.button(f"❌ Remove", key=f"remove_{idx}"):
+                            remove_item(idx)
+                    with col3:
+                        if st.button("⬆️ Move Up", key=f"move_up_sub_{idx}"):
+                            move_item_up(idx)
+                    with col4:
+                        if st.button("⬇️ Move Down", key=f"move_down_sub_{idx}"):
+                            move_item_down(idx)
+
+    # Grid mode: every line in one editable table, edits applied together as one change
+    @timed_fragment("Estimate grid")
+    def estimate_grid():
+        show_grid_editor(estimate, catalog)
+
+    if len(estimate) > 0:
+        st.toggle("📝 Bulk edit (grid)", key="grid_mode",
+                  help="Edit quantity, GST, remarks and order of all lines in one table")
+    if st.session_state.get('grid_mode', False) and len(estimate) > 0:
+        estimate_grid()
+    else:
+        estimate_list()
     # Add New Item or Subheading buttons
     button_col1, button_col2, button_col3, button_col4, button_col5, button_col6 = st.columns([2, 2, 2, 2, 2, 2])
     with button_col6:
@@ -565,16 +604,17 @@ def main_app():
             st.session_state.adding_subheading = False
             st.session_state.show_add_other = False
             st.rerun()
-    # Show Add Item section if toggled on
-    if st.session_state.get('show_add_item', False):
-        idx = len([i for i in st.session_state.selected_items if i.get("Type") != "Subheading"])
+    # Add Item panel: picking an item or typing a quantity only reruns the panel
+    @timed_fragment("Add Item")
+    def add_item_panel():
+        idx = estimate.item_count
         with st.container():
             st.markdown(f"<div class='estimate-item'>", unsafe_allow_html=True)
             col1, col2 = st.columns([3, 1])
             with col1:
                 item_name = st.selectbox(
                     "Select Item", 
-                    [''] + item_names, 
+                    ('',) + item_names, 
                     key=f"new_item_{idx}"
                 )
                 st.text(f"Item Description: {item_name}" if item_name else "")
@@ -591,16 +631,14 @@ def main_app():
                     key=f"new_item_gst_{idx}"
                 )
                 if item_name != '':
-                    item_data = data[data['Item Name'] == item_name].iloc[0]
-                    unit_price = item_data['Unit Price']
-                    unit = item_data['Item Unit']
-                    st.text(f"Rate: {unit_price:.2f}/{unit}")
+                    unit_price, unit = catalog.lookup(item_name)
+                    st.text(f"Rate: {format_money(unit_price, grouping=False)}/{unit}")
                     if quantity:
                         try:
                             qty = float(quantity)
                             if qty > 0:
-                                total = qty * unit_price
-                                st.text(f"Amount: {total:.2f}")
+                                total = catalog.cost(item_name, qty)
+                                st.text(f"Amount: {format_money(total, grouping=False)}")
                         except ValueError:
                             st.text("Invalid quantity")
 
@@ -611,20 +649,9 @@ def main_app():
                         try:
                             quantity = float(quantity)
                             if quantity > 0:
-                                item_data = data[data['Item Name'] == item_name].iloc[0]
-                                unit_price = item_data['Unit Price']
-                                unit = item_data['Item Unit']
-                                cost = round(quantity * unit_price, 2)
-                                st.session_state.selected_items.append({
-                                    'Item': item_name,
-                                    'Quantity': quantity,
-                                    'Unit Price': unit_price,
-                                    'Item Unit': unit,
-                                    'Cost': cost,
-                                    'Type': 'Standard',
-                                    'GST_Applicable': gst_applicable,
-                                    'Quantity_Remarks': ""
-                                })
+                                estimate.append(catalog.line_item(
+                                    item_name, quantity, gst_applicable=gst_applicable
+                                ))
                                 st.session_state.show_add_item = False
                                 st.success(f"Item '{item_name}' added successfully!")
                                 st.rerun()
@@ -637,23 +664,29 @@ def main_app():
                     st.rerun()
             st.markdown("</div>", unsafe_allow_html=True)
 
-    # Show Smart Filter if toggled on
-    if st.session_state.get('show_wizard', False):
-        show_item_wizard(wizard_data, handle_item_selection)
+    # Show Add Item section if toggled on
+    if st.session_state.get('show_add_item', False):
+        add_item_panel()
+
+    # Smart Filter: filters, search and page flips only rerun the wizard; picking
+    # an item adds it and reruns the whole page (handle_item_selection)
+    @timed_fragment("Smart Filter")
+    def smart_filter():
+        show_item_wizard(catalog, handle_item_selection)
         if st.button("✕ Close Wizard", key="close_wizard", type="primary"):
             st.session_state.show_wizard = False
             st.rerun()
+
+    # Show Smart Filter if toggled on
+    if st.session_state.get('show_wizard', False):
+        smart_filter()
         # Show Templates section if toggled on
     if st.session_state.get('show_templates', False):
-        template_data = load_templates()
-        template_names = list(template_data.keys())
+        templates = load_templates(catalog)
+        template_names = list(templates.keys())
     
         st.markdown("### 📄 Available Templates")
     
-        # Ensure selected_items list is initialized
-        if 'selected_items' not in st.session_state:
-            st.session_state.selected_items = []
-    
         # Display templates as buttons (3 per row)
         num_columns = 3
         for i in range(0, len(template_names), num_columns):
@@ -661,46 +694,18 @@ def main_app():
             for j in range(num_columns):
                 if i + j < len(template_names):
                     template_name = template_names[i + j]
+                    template = templates[template_name]
                     with cols[j]:
                         if st.button(f"📝 {template_name}", key=f"template_btn_{template_name}"):
-                            template_df = template_data[template_name]
-                            main_items_data = data  # From your existing load_main_items()
-    
-                            added_count = 0
-                            for _, row in template_df.iterrows():
-                                item_name = row['Item Name']
-                                quantity = row.get('Quantity', 0)
-    
-                                main_item = main_items_data[main_items_data['Item Name'] == item_name]
-    
-                                if not main_item.empty:
-                                    main_item = main_item.iloc[0]
-                                    st.session_state.selected_items.append({
-                                        'Item': item_name,
-                                        'Quantity': quantity,
-                                        'Unit Price': main_item['Unit Price'],
-                                        'Item Unit': main_item['Item Unit'],
-                                        'Cost': quantity * main_item['Unit Price'],
-                                        'Type': 'Standard',
-                                        'GST_Applicable': True,
-                                        'Quantity_Remarks': ""
-                                    })
-                                else:
-                                    st.session_state.selected_items.append({
-                                        'Item': item_name,
-                                        'Quantity': quantity,
-                                        'Unit Price': 0,
-                                        'Item Unit': '',
-                                        'Cost': 0,
-                                        'Type': 'Other',
-                                        'GST_Applicable': True,
-                                        'Quantity_Remarks': ""
-                                    })
-                                added_count += 1
+                            # Already resolved against this user's rates: a straight batch append
+                            estimate.extend(template.batch)
+                            added_count = len(template.batch)
+                            st.session_state.insert_report = (f"template '{template_name}'", template.unmatched)
     
                             st.success(f"✅ Added {added_count} items from '{template_name}' template!")
                             st.session_state.show_templates = False
                             st.rerun()
+                        st.caption(f"{len(template.batch)} items · ₹{format_money(template.total)}")
     
         # Cancel Button
         st.divider()
@@ -739,109 +744,13 @@ def main_app():
         
         if uploaded_file is not None:
             try:
-                # Read the uploaded file with openpyxl to handle merged cells
-                from openpyxl import load_workbook
-                wb = load_workbook(uploaded_file)
-                ws = wb.active
-                
-                # Check if it's an estimate generated by this app
-                is_app_estimate = False
+                # Parsed once per file content; later reruns reuse the cached items
                 try:
-                    # Check for the specific format of our app's estimate
-                    if (ws['B2'].value == "Item Name" and
-                        ws['E2'].value == "Qty"):
-                        is_app_estimate = True
-                except:
-                    pass
-                
-                items = []
-                current_subheading = None
-                
-                if is_app_estimate:
-                    # Find the "Subtotal" row by checking merged cells
-                    subtotal_row = None
-                    for merge in ws.merged_cells.ranges:
-                        if merge.min_row == merge.max_row:  # Only consider row merges
-                            first_cell = ws.cell(row=merge.min_row, column=merge.min_col)
-                            if first_cell.value == "Subtotal":
-                                subtotal_row = merge.min_row
-                                break
-                    
-                    if subtotal_row is None:
-                        st.error("Could not find 'Subtotal' row in the uploaded estimate")
-                        return
-                    
-                    # Set the range to process (rows 3 to subtotal_row)
-                    row_range = range(3, subtotal_row)
-                else:
-                    # For regular Excel files, process all rows (skip header if needed)
-                    row_range = range(1, ws.max_row + 1)
-                
-                # Process all rows in the determined range
-                for row in row_range:
-                    # Check if this row has any horizontal merged cells (subheading)
-                    is_subheading = False
-                    for merge in ws.merged_cells.ranges:
-                        if merge.min_row == row and merge.max_row == row:  # Horizontal merge only
-                            if merge.min_col <= 2 and merge.max_col >= 2:  # Merge includes column B (or first column)
-                                current_subheading = ws.cell(row=row, column=merge.min_col).value
-                                is_subheading = True
-                                break
-                    
-                    if is_subheading:
-                        # Add the subheading to our items list
-                        items.append({
-                            'Item Name': current_subheading,
-                            'Type': 'Subheading',
-                            'Merged': True
-                        })
-                        continue
-                    
-                    # Get cell values - different columns for app estimate vs regular file
-                    if is_app_estimate:
-                        item_name = ws.cell(row=row, column=2).value  # Column B
-                        quantity_cell = ws.cell(row=row, column=5).value  # Column E
-                        total_price_cell = ws.cell(row=row, column=6).value  # Column F (Total)
-                    else:
-                        item_name = ws.cell(row=row, column=1).value  # First column
-                        quantity_cell = ws.cell(row=row, column=2).value  # Second column
-                        total_price_cell = ws.cell(row=row, column=3).value if ws.max_column >= 3 else None  # Third column if exists
-                    
-                    # Skip empty rows
-                    if not item_name:
-                        continue
-                    
-                    # Process quantity cell to extract remarks
-                    quantity_str = str(quantity_cell).strip() if quantity_cell is not None else ""
-                    remarks = ""
-                    
-                    if "(" in quantity_str and ")" in quantity_str:
-                        parts = quantity_str.split("(", 1)
-                        remarks = parts[1].split(")", 1)[0].strip()
-                    
-                    quantity = None
-                    if quantity_str and quantity_str != "-":
-                        try:
-                            quantity = float(quantity_str.split("(")[0].strip())
-                        except ValueError:
-                            pass
-                    
-                    total_price = 0.0
-                    if total_price_cell is not None:
-                        try:
-                            total_price = float(total_price_cell)
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    items.append({
-                        'Item Name': item_name, 
-                        'Quantity': quantity,
-                        'Remarks': remarks,
-                        'Total Price': total_price,
-                        'Subheading': current_subheading  # Track which subheading this item belongs to
-                    })
-                
-                items_df = pd.DataFrame(items)
+                    parsed = st.session_state.upload_cache.get(uploaded_file.getvalue())
+                except UploadFormatError as e:
+                    st.error(str(e))
+                    return
+                items_df = parsed.items
                 
                 if items_df.empty:
                     st.error("No valid items found in the uploaded file")
@@ -850,54 +759,21 @@ def main_app():
                 # Display preview
                 st.markdown("**Preview of uploaded items:**")
                 st.dataframe(items_df.head())
+                if parsed.batch is not None and parsed.stamp == catalog.stamp:
+                    st.caption("Estimate exported from this app: items will be added exactly as saved (rates, GST, remarks).")
+                elif parsed.batch is not None:
+                    st.caption("Estimate exported from this app with other rates: items will be re-priced from your rate list "
+                               "(quantities, GST and remarks kept).")
                 
                 col1, col2 = st.columns([1, 1])
                 with col1:
                     if st.button("Add Uploaded Items", key="add_uploaded_items"):
-                        main_items_data = data
-                        added_count = 0
-                        
-                        for _, row in items_df.iterrows():
-                            if row.get('Type') == 'Subheading':
-                                # Add subheading to the estimate
-                                st.session_state.selected_items.append({
-                                    'Item': row['Item Name'],
-                                    'Type': 'Subheading'
-                                })
-                                continue
-                                
-                            item_name = row['Item Name']
-                            quantity = row['Quantity']
-                            remarks = row.get('Remarks', '')
-                            total_price = row.get('Total Price', 0.0)
-                            
-                            # Find the item in main data
-                            main_item = main_items_data[main_items_data['Item Name'] == item_name]
-                            
-                            if not main_item.empty and quantity is not None:
-                                # Standard item
-                                main_item = main_item.iloc[0]
-                                st.session_state.selected_items.append({
-                                    'Item': item_name,
-                                    'Quantity': float(quantity),
-                                    'Unit Price': main_item['Unit Price'],
-                                    'Item Unit': main_item['Item Unit'],
-                                    'Cost': float(quantity) * main_item['Unit Price'],
-                                    'Type': 'Standard',
-                                    'GST_Applicable': True,
-                                    'Quantity_Remarks': remarks
-                                })
-                                added_count += 1
-                            else:
-                                # Other item
-                                st.session_state.selected_items.append({
-                                    'Item': item_name,
-                                    'Cost': float(total_price),
-                                    'Type': 'Other',
-                                    'GST_Applicable': True,
-                                    'Quantity_Remarks': remarks
-                                })
-                                added_count += 1
+                        # Our own unedited export priced from these rates: its lines as saved;
+                        # anything else is joined against this user's catalog
+                        batch, unmatched = parsed.line_items(catalog)
+                        estimate.extend(batch)
+                        added_count = sum(1 for item in batch if not item.is_subheading)
+                        st.session_state.insert_report = ("uploaded file", unmatched)
                         
                         st.success(f"Added {added_count} items from uploaded file!")
                         st.session_state.show_upload = False
@@ -920,10 +796,7 @@ def main_app():
         with col1:
             if st.button("Add Subheading to Estimate", key="confirm_subheading"):
                 if subheading.strip():
-                    st.session_state.selected_items.append({
-                        'Item': subheading.strip(),
-                        'Type': 'Subheading'
-                    })
+                    estimate.append(LineItem.subheading(subheading.strip()))
                     st.session_state.adding_subheading = False
                     st.success(f"Subheading '{subheading.strip()}' added!")
                     st.rerun()
@@ -962,14 +835,9 @@ def main_app():
                 if st.button(f"Add Custom Item", key=f"add_other_item"):
                     if item_name and total_price:
                         try:
-                            price = float(total_price)
+                            price = to_paise(total_price)
                             if price > 0:
-                                st.session_state.selected_items.append({
-                                    'Item': item_name,
-                                    'Cost': price,
-                                    'Type': 'Other',
-                                    'GST_Applicable': gst_applicable
-                                })
+                                estimate.append(LineItem.other(item_name, price, gst_applicable))
                                 st.session_state.show_add_other = False
                                 st.success(f"Custom item '{item_name}' added successfully!")
                                 st.rerun()
@@ -982,461 +850,97 @@ def main_app():
                     st.rerun()
             st.markdown("</div>", unsafe_allow_html=True)
 
-    # Totals and file generation
-    if any(i.get("Type") != "Subheading" for i in st.session_state.selected_items):
-        total_cost, gst, unforeseen, final_total = calculate_totals()
-        st.subheader("Estimate Breakdown")
-        st.write(f"Subtotal: ₹{total_cost:,.2f}")
-        st.write(f"GST (18% on taxable items): ₹{gst:,.2f}")
-        st.write(f"Unforeseen (1%): ₹{unforeseen:,.2f}")
-        st.write(f"Final Total: ₹{final_total:,.2f}")
-
-        # File generation buttons
-        col1, col2, col3, col4 = st.columns([2, 2, 1, 1])  # Added a 4th column for preview
-        with col1:
-            if st.button("📄 Generate Excel", key="generate_excel"):
-                wb = Workbook()
-                ws = wb.active
-                ws.title = "Estimate"
-                
-                # Header
-                ws.merge_cells('A1:G1')
-                ws['A1'] = estimate_heading
-                ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
-                ws['A1'].font = ws['A1'].font.copy(bold=True, size=14)
-                
-                # Table headers
-                headers = ["Sl.No", "Item Name", "Rate", "Unit", "Qty", "Total", "GST"]
-                ws.append(headers)
-                
-                # Add items
-                row_num = 3
-                serial = 1
-                for item in st.session_state.selected_items:
-                    if item.get("Type") == "Subheading":
-                        ws.merge_cells(f'A{row_num}:G{row_num}')
-                        ws[f'A{row_num}'] = f" {item['Item']}"
-                        row_num += 1
-                    elif item.get("Type") == "Other":
-                        remark = item.get('Quantity_Remarks', '')
-                        qty_field = f"- ({remark})" if remark else "-"
-                        ws.append([
-                            serial,
-                            item['Item'],
-                            "-",
-                            "-",
-                            qty_field,
-                            item['Cost'],
-                            "Yes" if item.get('GST_Applicable', False) else "No"
-                        ])
-                        serial += 1
-                        row_num += 1
-                    else:
-                        ws.append([
-                            serial,
-                            item['Item'],
-                            item['Unit Price'],
-                            item['Item Unit'],
-                            f"{item['Quantity']} ({item['Quantity_Remarks']})" if item.get('Quantity_Remarks') else item['Quantity'],
-                            item['Cost'],
-                            "Yes" if item.get('GST_Applicable', True) else "No"
-                        ])
-                        serial += 1
-                        row_num += 1
-
-                # Add totals
-                for label, val in [
-                    ("Subtotal", total_cost),
-                    ("GST (18%)", gst),
-                    ("Unforeseen (1%)", unforeseen),
-                    ("Grand Total", final_total)
-                ]:
-                    ws.merge_cells(f'A{row_num}:E{row_num}')
-                    ws[f'A{row_num}'] = label
-                    ws[f'F{row_num}'] = val
-                    row_num += 1
-
-                # Apply styling
-                thin_border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
-                
-                for row in ws.iter_rows(min_row=1, max_row=row_num-1, min_col=1, max_col=7):
-                    for cell in row:
-                        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                        cell.border = thin_border
-
-                ws.column_dimensions['B'].width = 70
-                excel_file = "estimate.xlsx"
-                wb.save(excel_file)
-
-                with open(excel_file, "rb") as f:
-                    st.download_button(
-                        "⬇️ Download Excel",
-                        f,
-                        file_name=excel_file,
-                        mime="application/vnd.ms-excel",
-                        key="download_excel"
+    # Totals, exports and preview: generating a file or opening the preview only
+    # reruns this part; Clear All changes the estimate and reruns the whole page
+    @timed_fragment("Totals")
+    def totals_panel():
+        if estimate.item_count > 0:
+            total_cost, gst, unforeseen, final_total = calculate_totals()
+            st.subheader("Estimate Breakdown")
+            st.write(f"Subtotal: ₹{format_money(total_cost)}")
+            st.write(f"GST (18% on taxable items): ₹{format_money(gst)}")
+            st.write(f"Unforeseen (1%): ₹{format_money(unforeseen)}")
+            st.write(f"Final Total: ₹{format_money(final_total)}")
+        
+            # Per-subheading subtotals (only useful once the estimate has subheadings)
+            section_rows = estimate.section_subtotals()
+            if len(estimate.sections) > 1:
+                with st.expander("Section Subtotals"):
+                    st.dataframe(
+                        pd.DataFrame(
+                            [{"Section": heading, "Items": lines, "Subtotal": f"₹{format_money(subtotal)}"}
+                             for heading, lines, subtotal in section_rows]
+                        ),
+                        use_container_width=True,
+                        hide_index=True
                     )
-        with col2:
-              if st.button("Generate PDF"):
-                  from fpdf import FPDF
-              
-                  pdf = FPDF()
-                  def add_watermark(pdf):
-                      """Function to add a diagonal watermark to every page"""
-                      pdf.set_font("Arial", style='B', size=72)
-                      pdf.set_text_color(180, 240, 230)  # Light magenta color for watermark
-                  
-                      text = "GROUND WATER DEPARTMENT"
-                      text_width = pdf.get_string_width(text)
-                      text_height = 72  # Approximate height of the text
-                  
-                      # Set the rotation angle for the watermark (diagonal, bottom-left to top-right)
-                      pdf.rotate(54.8, x=0, y=pdf.h)  # Rotate around the bottom-left corner
-                  
-                      # Position the text starting from the bottom-left corner with a little padding
-                      x = 0  # Padding from the left
-                      y = pdf.h  # Padding from the bottom
-                  
-                      # Print the watermark diagonally
-                      pdf.text(x, y, text)
-                  
-                      # Reset rotation to avoid affecting other content
-                      pdf.rotate(0)
-                      
-                      pdf.set_text_color(0, 0, 0)  # Black color for the main content
-                        
-                  pdf.set_auto_page_break(auto=True, margin=15)
-                  pdf.add_page()
-                  add_watermark(pdf)
-                  # Main content
-                  pdf.set_font("Arial", 'B', 16)
-                  pdf.set_text_color(0, 0, 0)
-                  
-                  # Add user info at top right
-                  pdf.set_font("Arial", '', 10)
-                  user_info = f"User: {username}\nCost Index: {cost_index}"
-                  pdf.set_xy(pdf.w - 60, 15)  # Position at top right with some margin
-                  pdf.multi_cell(50, 5, user_info, 0, 'R')  # Right-aligned multi-cell for multiple lines
-                  
-                  # Center the main heading below the user info
-                  pdf.set_y(40)  # Move down a bit from top
-                  pdf.set_font("Arial", 'B', 16)
-                  
-                  # Calculate width of heading text
-                  heading_width = pdf.get_string_width(estimate_heading)
-                  
-                  # If heading is too wide for page (with 20mm margins on each side)
-                  if heading_width > (pdf.w - 40):
-                      # Split heading into multiple lines
-                      words = estimate_heading.split()
-                      lines = []
-                      current_line = ""
-                      
-                      for word in words:
-                          test_line = f"{current_line} {word}" if current_line else word
-                          if pdf.get_string_width(test_line) < (pdf.w - 40):
-                              current_line = test_line
-                          else:
-                              lines.append(current_line)
-                              current_line = word
-                      if current_line:
-                          lines.append(current_line)
-                      
-                      # Write each line centered
-                      for line in lines:
-                          pdf.cell(200, 10, txt=line, ln=True, align='C')
-                  else:
-                      # Single line if it fits
-                      pdf.cell(200, 10, txt=estimate_heading, ln=True, align='C')
 
-              
-                  col_widths = [10, 70, 20, 20, 20, 30]
-                  headers = ["Sl.No", "Item Name", "Rate", "Unit", "Qty", "Total"]
-              
-                  def split_text(text, max_width):
-                      """Split text into multiple lines based on available width"""
-                      if not isinstance(text, str):
-                          text = str(text)
-                      lines = []
-                      words = text.split()
-                      current_line = ""
-              
-                      for word in words:
-                          test_line = current_line + " " + word if current_line else word
-                          if pdf.get_string_width(test_line) < max_width - 2:
-                              current_line = test_line
-                          else:
-                              lines.append(current_line)
-                              current_line = word
-                      if current_line:
-                          lines.append(current_line)
-                      return lines
-              
-                  def calculate_max_lines(row_data):
-                      """Calculate maximum lines needed for any cell in the row"""
-                      max_lines = 1
-                      for i, text in enumerate(row_data):
-                          lines = split_text(str(text), col_widths[i])
-                          if len(lines) > max_lines:
-                              max_lines = len(lines)
-                      return max_lines
-              
-                  def draw_table_header():
-                      """Draw the table header on new pages"""
-                      pdf.set_font("Arial", 'B', 10)
-                      x_start = pdf.get_x()
-                      y_start = pdf.get_y()
-                      pdf.rect(x_start, y_start, sum(col_widths), 6)  # Header border
-              
-                      for i in range(1, len(col_widths)):
-                          pdf.line(
-                              x_start + sum(col_widths[:i]), y_start,
-                              x_start + sum(col_widths[:i]), y_start + 6
-                          )
-              
-                      for i, header in enumerate(headers):
-                          pdf.set_xy(x_start + sum(col_widths[:i]), y_start)
-                          pdf.cell(col_widths[i], 6, header, 0, 0, 'C')
-              
-                      pdf.set_y(y_start + 6)
-              
-                  pdf.ln(10)
-                  draw_table_header()
-                  pdf.set_font("Arial", '', 10)
-              
-                  serial = 1
-                  for item in st.session_state.selected_items:
-                      # Check if we need a new page (with buffer for row height)
-                      if pdf.get_y() + 20 > pdf.h - 30:  # Increased buffer to 20
-                          pdf.add_page()
-                          add_watermark(pdf)
-                          draw_table_header()
-                          pdf.set_font("Arial", '', 10)  # Reset font after header
-              
-                      if item.get("Type") == "Subheading":
-                          pdf.set_font("Arial", 'B', 10)  # Subheading bold
-                          pdf.set_xy(pdf.get_x(), pdf.get_y())
-                          pdf.cell(sum(col_widths), 6, f" {item['Item']}", border=1, align='C')
-                          pdf.ln(6)
-                          pdf.set_font("Arial", '', 10)
-                          continue  # Skip to next item after subheading
-                      
-                      gst_applicable = item.get('GST_Applicable', True)
-              
-                      if item.get("Type") == "Other":
-                          rate_text = "-"
-                          unit_text = "-"
-                          remark = item.get('Quantity_Remarks', '')
-                          qty_text = f"- ({remark})" if remark else "-"
-                      else:
-                          rate_text = f"{item['Unit Price']:.2f}"
-                          unit_text = item['Item Unit']
-                          remark = item.get('Quantity_Remarks', '')
-                          if remark:
-                              qty_text = f"{item['Quantity']:.2f} ({remark})"
-                          else:
-                              remark = item.get('Quantity_Remarks', '')
-                              if remark:
-                                  qty_text = f"{item['Quantity']:.2f} ({remark})"
-                              else:
-                                  qty_text = f"{item['Quantity']:.2f}"
-              
-                      total_text = f"{item['Cost']:.2f}"
-                      if not gst_applicable:
-                          total_text += " (No GST)"
-              
-                      row_data = [
-                          str(serial),
-                          item['Item'],
-                          rate_text,
-                          unit_text,
-                          qty_text,
-                          total_text
-                      ]
-              
-                      x_row_start = pdf.get_x()
-                      y_row_start = pdf.get_y()
-              
-                      max_lines = calculate_max_lines(row_data)
-                      row_height = 6 * max_lines
-                      
-                      # Ensure we have space for this row
-                      if pdf.get_y() + row_height > pdf.h - 30:
-                          pdf.add_page()
-                          add_watermark(pdf)
-                          draw_table_header()
-                          pdf.set_font("Arial", '', 10)
-                          x_row_start = pdf.get_x()
-                          y_row_start = pdf.get_y()
-              
-                      # Draw the row border
-                      pdf.rect(x_row_start, y_row_start, sum(col_widths), row_height)
-                      
-                      # Draw vertical lines
-                      for i in range(1, len(col_widths)):
-                          pdf.line(
-                              x_row_start + sum(col_widths[:i]), y_row_start,
-                              x_row_start + sum(col_widths[:i]), y_row_start + row_height
-                          )
-              
-                      # If the item type is "Other", round the serial number
-                      if item.get("Type") == "Other":
-                          # Draw a circle for serial number
-                          x = x_row_start + col_widths[0] / 2
-                          y = y_row_start + row_height / 2
-                          r = 4  # radius
-                          pdf.ellipse(x - r, y - r, r * 2, r * 2)
-                  
-                          # Set the serial number for the first column and round it
-                          pdf.set_xy(x_row_start, y_row_start)
-                          pdf.cell(col_widths[0], row_height, str(round(serial)), 0, 0, 'C')
-                      else:
-                          pdf.set_xy(x_row_start, y_row_start)
-                          pdf.cell(col_widths[0], row_height, str(serial), 0, 0, 'C')  # Normal serial number
-              
-                      for i, text in enumerate(row_data[1:], 1):  # Start from index 1 (skip serial number)
-                          pdf.set_xy(x_row_start + sum(col_widths[:i]), y_row_start)
-              
-                          cell_lines = split_text(str(text), col_widths[i])
-              
-                          vertical_offset = (row_height - (6 * len(cell_lines))) / 2
-              
-                          for line in cell_lines:
-                              pdf.set_xy(x_row_start + sum(col_widths[:i]), y_row_start + vertical_offset)
-                              pdf.cell(col_widths[i], 6, line, 0, 0, 'C')
-                              vertical_offset += 6
-              
-                      pdf.set_y(y_row_start + row_height)
-                      serial += 1
-              
-                  # Summary Section
-                  summary_data = [
-                      ("Subtotal", f"{total_cost:.2f}"),
-                      ("GST (18%)", f"{gst:.2f}"),
-                      ("Unforeseen (1%)", f"{unforeseen:.2f}"),
-                      ("Grand Total", f"{final_total:.2f}")
-                  ]
-              
-                  for label, value in summary_data:
-                      row_height = 8
-                      if pdf.get_y() + row_height > pdf.h - 30:
-                          pdf.add_page()
-                          add_watermark(pdf)
-                          pdf.set_font("Arial", '', 10)  # Reset the correct font and size
-                  
-                      x = pdf.get_x()
-                      y = pdf.get_y()
-                      
-                      # Set bold font for summary items
-                      pdf.set_font("Arial", 'B', 10)  # Changed to bold
-
-                      # Draw both label and value in the same row
-                      pdf.set_xy(x, y)
-                      pdf.cell(sum(col_widths[:-1]), row_height, label, border=1, align='C')
-                  
-                      pdf.set_xy(x + sum(col_widths[:-1]), y)
-                      pdf.cell(col_widths[-1], row_height, value, border=1, align='C')
-                  
-                      # Move to next line
-                      pdf.set_y(y + row_height)
-              
-                  # Signature Area
-                  if pdf.get_y() + 20 > pdf.h - 30:
-                      pdf.add_page()
-              
-                  pdf.set_font("Arial", 'B', 12)
-                  pdf.set_xy(pdf.w - 70, pdf.h - 40)
-                  pdf.cell(60, 10, "District Officer", ln=True, align='C')
-                  pdf.set_xy(pdf.w - 70, pdf.h - 30)
-                  pdf.cell(60, 10, "(Seal & Signature)", ln=True, align='C')
-              
-                  # Save and offer download
-                  pdf_file = "estimate.pdf"
-                  pdf.output(pdf_file)
-              
-                  with open(pdf_file, "rb") as f:
-                      st.download_button(
-                          label="⬇️ Download PDF",
-                          data=f,
-                          file_name=pdf_file,
-                          mime="application/pdf"
-                      )
-        with col3:
-            if st.button("👁️ Preview", key="preview_estimate"):
-                st.session_state.show_preview = not st.session_state.get('show_preview', False)
-                st.rerun()
-        with col4:
-            if st.button("🗑️ Clear All", key="clear_all", 
-                        help="Remove all items and start fresh"):
-                st.session_state.selected_items = []
-                st.session_state.item_count = 0
-                st.session_state.adding_subheading = False
-                st.session_state.show_wizard = False
-                st.session_state.show_add_item = False
-                st.session_state.show_add_other = False
-                st.rerun()        
-    # Add this right after the totals section but before the "else" for "No items added"
-    if st.session_state.get('show_preview', False) and any(i.get("Type") != "Subheading" for i in st.session_state.selected_items):
-        st.markdown("---")
-        st.subheader("Estimate Preview")
+            # File generation buttons
+            col1, col2, col3, col4 = st.columns([2, 2, 1, 1])  # Added a 4th column for preview
+            with col1:
+                if st.button("📄 Generate Excel", key="generate_excel"):
+                    # Built in the background; unchanged estimates come straight from the cache
+                    start_export("xlsx", lambda pool: pool.submit_excel(estimate, estimate_heading, catalog.stamp))
+                show_export("xlsx", export_key("xlsx", estimate, estimate_heading, catalog.stamp),
+                            "⬇️ Download Excel", "estimate.xlsx", EXCEL_MIME)
+            with col2:
+                  if st.button("Generate PDF"):
+                      start_export("pdf", lambda pool: pool.submit_pdf(estimate, estimate_heading, username, cost_index))
+                  show_export("pdf", export_key("pdf", estimate, estimate_heading, username, cost_index),
+                              "⬇️ Download PDF", "estimate.pdf", PDF_MIME)
+            with col3:
+                # Callbacks run before the fragment reruns, so no extra st.rerun() is needed
+                st.button("👁️ Preview", key="preview_estimate", on_click=toggle_preview)
+            with col4:
+                if st.button("🗑️ Clear All", key="clear_all", 
+                            help="Remove all items and start fresh"):
+                    estimate.clear()
+                    st.session_state.item_count = 0
+                    st.session_state.adding_subheading = False
+                    st.session_state.show_wizard = False
+                    st.session_state.show_add_item = False
+                    st.session_state.show_add_other = False
+                    st.rerun()        
+        # Add this right after the totals section but before the "else" for "No items added"
+        if st.session_state.get('show_preview', False) and estimate.item_count > 0:
+            st.markdown("---")
+            st.subheader("Estimate Preview")
         
-        # Create a preview dataframe
-        preview_data = []
-        for idx, item in enumerate(st.session_state.selected_items):
-            if item.get("Type") == "Subheading":
-                preview_data.append({
-                    "Item": f"📌 {item['Item']}",
-                    "Quantity": "",
-                    "Unit": "",
-                    "Rate": "",
-                    "Amount": ""
-                })
-            else:
-                if item.get("Type") == "Other":
-                    preview_data.append({
-                        "Item": f"🔹 {item['Item']}",
-                        "Quantity": "-",
-                        "Unit": "-",
-                        "Rate": "-",
-                        "Amount": f"₹{item['Cost']:,.2f}"
-                    })
+            # Same rows (and text) as the Excel/PDF exports, built once per estimate version
+            model = estimate.render_model()
+            preview_data = []
+            for line in model:
+                if line.is_subheading:
+                    preview_data.append({"Sl.No": "", "Item": f"📌 {line.name}", "Quantity": "",
+                                         "Unit": "", "Rate": "", "Amount": ""})
                 else:
-                    remark = f" ({item['Quantity_Remarks']})" if item.get('Quantity_Remarks') else ""
+                    serial, name, rate, unit, quantity, amount = line.cells
                     preview_data.append({
-                        "Item": item['Item'],
-                        "Quantity": f"{item['Quantity']}{remark}",
-                        "Unit": item['Item Unit'],
-                        "Rate": f"₹{item['Unit Price']:,.2f}",
-                        "Amount": f"₹{item['Cost']:,.2f}"
+                        "Sl.No": serial,
+                        "Item": f"🔹 {name}" if line.item_type == OTHER else name,
+                        "Quantity": quantity,
+                        "Unit": unit,
+                        "Rate": rate if line.item_type == OTHER else f"₹{rate}",
+                        "Amount": f"₹{amount}"
                     })
         
-        # Convert to dataframe and display
-        preview_df = pd.DataFrame(preview_data)
-        st.dataframe(
-            preview_df,
-            use_container_width=True,
-            hide_index=True
-        )
+            # Convert to dataframe and display
+            preview_df = pd.DataFrame(preview_data)
+            st.dataframe(
+                preview_df,
+                use_container_width=True,
+                hide_index=True
+            )
         
-        # Add totals to the preview
-        total_cost, gst, unforeseen, final_total = calculate_totals()
-        st.markdown(f"""
-        **Subtotal:** ₹{total_cost:,.2f}  
-        **GST (18%):** ₹{gst:,.2f}  
-        **Unforeseen (1%):** ₹{unforeseen:,.2f}  
-        **Final Total:** ₹{final_total:,.2f}
-        """)
+            # Add totals to the preview
+            st.markdown("  \n".join(f"**{label}:** ₹{format_money(paise)}" for label, paise in model.totals))
         
-        if st.button("Close Preview", key="close_preview"):
-            st.session_state.show_preview = False
-            st.rerun()
-    else:
-        st.info("No items added to the estimate yet.")
+            st.button("Close Preview", key="close_preview", on_click=toggle_preview)
+        else:
+            st.info("No items added to the estimate yet.")
+
+    totals_panel()
+
 # Check authentication
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
@@ -1510,22 +1014,22 @@ st.sidebar.markdown("""
 """, unsafe_allow_html=True)
 
 
-if st.session_state.get('authenticated', False):
+# Library downloads: opening/closing a section only reruns the sidebar
+@timed_fragment("Sidebar library")
+def sidebar_library():
     # Add the DSR download button and dropdowns
     # DSR/DAR button
-    if st.sidebar.button("Download DSR/DAR"):
-        toggle_section('show_dsr_options')
-        st.rerun()  # Force immediate update
+    st.button("Download DSR/DAR", on_click=toggle_section, args=('show_dsr_options',))
 
     if st.session_state.get('show_dsr_options', False):
         # Year selection
-        selected_year = st.sidebar.selectbox("Select Year", ["2018", "2021"])
+        selected_year = st.selectbox("Select Year", ["2018", "2021"])
         
         # Document type selection
-        doc_type = st.sidebar.selectbox("Select Document Type", ["DSR", "DAR"])
+        doc_type = st.selectbox("Select Document Type", ["DSR", "DAR"])
         
         # Volume selection
-        volume = st.sidebar.selectbox("Select Volume", ["Vol 1", "Vol 2"])
+        volume = st.selectbox("Select Volume", ["Vol 1", "Vol 2"])
         
         # Construct the file path
         file_path = f"DSR/{selected_year}/{doc_type}/{volume}.pdf"
@@ -1533,94 +1037,88 @@ if st.session_state.get('authenticated', False):
         # Display download button
         try:
             with open(file_path, "rb") as file:
-                st.sidebar.download_button(
+                st.download_button(
                     label=f"⬇️ Download {selected_year} {doc_type} {volume}",
                     data=file,
                     file_name=f"{selected_year}_{doc_type}_{volume}.pdf",
                     mime="application/pdf"
                 )
         except FileNotFoundError:
-            st.sidebar.error("Requested file not found")
+            st.error("Requested file not found")
         except Exception as e:
-            st.sidebar.error(f"Error downloading file: {str(e)}")
+            st.error(f"Error downloading file: {str(e)}")
     if 'show_price_options' not in st.session_state:
         st.session_state.show_price_options = False
     # Add PRICE Rates download button
     # PRICE Rates button
-    if st.sidebar.button("Download PRICE Rates"):
-        toggle_section('show_price_options')
-        st.rerun()
+    st.button("Download PRICE Rates", on_click=toggle_section, args=('show_price_options',))
 
     if st.session_state.get('show_price_options', False):
         try:
             with open("PRICE Rates (DSR 21).xlsx", "rb") as file:
-                st.sidebar.download_button(
+                st.download_button(
                     label="⬇️ Download PRICE Rates (DSR 21) Excel",
                     data=file,
                     file_name="PRICE Rates (DSR 21).xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
         except FileNotFoundError:
-            st.sidebar.error("PRICE Rates file not found")
+            st.error("PRICE Rates file not found")
         except Exception as e:
-            st.sidebar.error(f"Error downloading PRICE Rates: {str(e)}")
+            st.error(f"Error downloading PRICE Rates: {str(e)}")
             
     if 'show_dsr21basicrates_options' not in st.session_state:
         st.session_state.show_dsr21basicrates_options = False
     # Add DSR 21 Basic Rates download button
     # Basic Rates button
-    if st.sidebar.button("Download Basic Rates"):
-        toggle_section('show_dsr21basicrates_options')
-        st.rerun()
+    st.button("Download Basic Rates", on_click=toggle_section, args=('show_dsr21basicrates_options',))
 
     
     if st.session_state.get('show_dsr21basicrates_options', False):
         try:
             with open("DSR 21 Basic Rates.xlsx", "rb") as file:
-                st.sidebar.download_button(
+                st.download_button(
                     label="⬇️ Download Basic Rates (DSR 21) Excel",
                     data=file,
                     file_name="DSR 21 Basic Rates.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
         except FileNotFoundError:
-            st.sidebar.error("DSR 21 Basic Rates file not found")
+            st.error("DSR 21 Basic Rates file not found")
         except Exception as e:
-            st.sidebar.error(f"Error downloading DSR 21 Basic Rates: {str(e)}")
+            st.error(f"Error downloading DSR 21 Basic Rates: {str(e)}")
         try:
             with open("DSR 21 Basic Rates.pdf", "rb") as file:
-                st.sidebar.download_button(
+                st.download_button(
                     label="⬇️ Download Basic Rates (DSR 21) PDF",
                     data=file,
                     file_name="DSR 21 Basic Rates.pdf",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
         except FileNotFoundError:
-            st.sidebar.error("DSR 21 Basic Rates file not found")
+            st.error("DSR 21 Basic Rates file not found")
         except Exception as e:
-            st.sidebar.error(f"Error downloading DSR 21 Basic Rates: {str(e)}")    
+            st.error(f"Error downloading DSR 21 Basic Rates: {str(e)}")    
     if 'show_priceapprovedmr_options' not in st.session_state:
         st.session_state.show_priceapprovedmr_options = False
     
     # Add PRICE Approved MR download button
     # PRICE Approved MR button
-    if st.sidebar.button("PRICE Approved MR"):
-        toggle_section('show_priceapprovedmr_options')
-        st.rerun()
+    st.button("PRICE Approved MR", on_click=toggle_section, args=('show_priceapprovedmr_options',))
     
     if st.session_state.get('show_priceapprovedmr_options', False):
         try:
             with open("PRICE Approved MR.pdf", "rb") as file:
-                st.sidebar.download_button(
+                st.download_button(
                     label="⬇️ Download PRICE Approved MR PDF",
                     data=file,
                     file_name="PRICE Approved MR.pdf",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
         except FileNotFoundError:
-            st.sidebar.error("PRICE Approved MR file not found")
+            st.error("PRICE Approved MR file not found")
         except Exception as e:
-            st.sidebar.error(f"Error downloading PRICE Approved MR: {str(e)}")
+            st.error(f"Error downloading PRICE Approved MR: {str(e)}")
     if 'show_gwd_options' not in st.session_state:
         st.session_state.show_gwd_options = False
     if 'show_costindex_options' not in st.session_state:
@@ -1628,31 +1126,27 @@ if st.session_state.get('authenticated', False):
     
     # Add Cost Index 2021 download button
     # Cost Index 2021 button
-    if st.sidebar.button("Cost Index 2021"):
-        toggle_section('show_costindex_options')
-        st.rerun()
+    st.button("Cost Index 2021", on_click=toggle_section, args=('show_costindex_options',))
     
     if st.session_state.get('show_costindex_options', False):
         try:
             with open("Cost Index 2021.pdf", "rb") as file:
-                st.sidebar.download_button(
+                st.download_button(
                     label="⬇️ Download Cost Index 2021 PDF",
                     data=file,
                     file_name="Cost Index 2021.pdf",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
         except FileNotFoundError:
-            st.sidebar.error("Cost Index 2021 file not found")
+            st.error("Cost Index 2021 file not found")
         except Exception as e:
-            st.sidebar.error(f"Error downloading Cost Index 2021: {str(e)}")
+            st.error(f"Error downloading Cost Index 2021: {str(e)}")
     if 'show_gwd_options' not in st.session_state:
         st.session_state.show_gwd_options = False
         
     # Add GWD Data download button - similar to DSR download
     # GWD Data button
-    if st.sidebar.button("Download GWD Data"):
-        toggle_section('show_gwd_options')
-        st.rerun()
+    st.button("Download GWD Data", on_click=toggle_section, args=('show_gwd_options',))
 
     if st.session_state.get('show_gwd_options', False):
         try:
@@ -1665,13 +1159,13 @@ if st.session_state.get('authenticated', False):
                 gwd_files = [f for f in os.listdir(gwd_dir) if os.path.isfile(os.path.join(gwd_dir, f))]
             
             if not gwd_files:
-                st.sidebar.warning("No files found in GWD Data directory")
+                st.warning("No files found in GWD Data directory")
             else:
                 # Sort files alphabetically
                 gwd_files.sort()
                 
                 # Create dropdown to select file
-                selected_file = st.sidebar.selectbox(
+                selected_file = st.selectbox(
                     "Select GWD Data File",
                     gwd_files,
                     key="gwd_file_select"
@@ -1694,7 +1188,7 @@ if st.session_state.get('authenticated', False):
                 mime_type = mime_types.get(file_ext, 'application/octet-stream')
                 
                 with open(file_path, "rb") as file:
-                    st.sidebar.download_button(
+                    st.download_button(
                         label=f"⬇️ Download {selected_file}",
                         data=file,
                         file_name=selected_file,
@@ -1702,20 +1196,18 @@ if st.session_state.get('authenticated', False):
                     )
                     
         except Exception as e:
-            st.sidebar.error(f"Error accessing GWD Data: {str(e)}")    
+            st.error(f"Error accessing GWD Data: {str(e)}")    
     # Add to your session state initialization (if not already present)
     if 'show_pump_selector' not in st.session_state:
         st.session_state.show_pump_selector = False
     
     # In your sidebar section:
     # Pump Selector button
-    if st.sidebar.button("Pump Selector"):
-        toggle_section('show_pump_selector')
-        st.rerun()
+    st.button("Pump Selector", on_click=toggle_section, args=('show_pump_selector',))
     
     if st.session_state.show_pump_selector:
         # In your Pump Selector section, change the button HTML to:
-        st.sidebar.markdown("""
+        st.markdown("""
         <div style="background-color:#f0f2f6; padding:10px; border-radius:5px; margin-top:10px;">
             <p style="margin-bottom:10px;">Pump Selector will open in a new tab</p>
             <a href="https://gwdpumpdesign.streamlit.app/" target="_blank" class="pump-selector-btn" style="text-decoration:none;">
@@ -1731,7 +1223,15 @@ if st.session_state.get('authenticated', False):
         </div>
         """, unsafe_allow_html=True)
     # Add logout button if authenticated  
-    if st.sidebar.button("Logout"):
+    if st.button("Logout"):
         st.session_state.authenticated = False
         st.session_state.logged_in_username = None
-        st.rerun()        
\ No newline at end of file
+        st.rerun()        
+
+
+if st.session_state.get('authenticated', False):
+    with st.sidebar:
+        sidebar_library()
+
+record_timing("Full page", page_started)
+show_render_timings()
@@ -0,0 +1,66 @@
+import io
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl import load_workbook
+
+from estimate import Estimate, LineItem
+from exports import build_excel, build_pdf
+
+SESSIONS = 16
+
+
+def session_estimate(n):
+    """A different estimate per simulated session (line count and rates depend on n)"""
+    items = [LineItem.subheading(f"Works of session {n}")]
+    for i in range(20 + n * 7):
+        items.append(LineItem.standard(f"Item {i} of session {n}", i % 5 + 1, 10000 + n * 100 + i, "Nos"))
+    items.append(LineItem.other(f"Other work of session {n}", 250000 + n))
+    return Estimate(items)
+
+
+def pdf_text(data):
+    """Content of every (Flate-compressed) stream in the PDF, decompressed"""
+    chunks = []
+    for stream in re.findall(rb"stream\r?\n(.*?)\r?\nendstream", data, re.S):
+        try:
+            chunks.append(zlib.decompress(stream))
+        except zlib.error:
+            chunks.append(stream)
+    return b"\n".join(chunks)
+
+
+def test_concurrent_sessions_get_their_own_files(tmp_path, monkeypatch):
+    # Exports are built in memory: run every builder from a thread pool in an
+    # empty working directory, as many sessions clicking Generate at once
+    monkeypatch.chdir(tmp_path)
+    sessions = [(n, session_estimate(n), f"Heading for session {n}", f"user{n}") for n in range(SESSIONS)]
+
+    def export(session):
+        n, estimate, heading, username = session
+        return (build_excel(estimate, heading),
+                build_pdf(estimate, heading, username, f"1.{n:04d}"))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(export, sessions * 2))
+
+    for (n, estimate, heading, username), (excel, pdf) in zip(sessions * 2, results):
+        ws = load_workbook(io.BytesIO(excel), read_only=True)["Estimate"]
+        rows = list(ws.iter_rows(values_only=True))
+        assert rows[0][0] == heading
+        assert len(rows) == len(estimate) + 6
+        # Subheading rows carry their text in column A, lines in column B
+        names = [row[1] or row[0] for row in rows[2:len(estimate) + 2]]
+        assert names[1] == f"Item 0 of session {n}"
+        assert all(name.endswith(f"of session {n}") for name in names)
+
+        text = pdf_text(pdf)
+        assert f"({heading})".encode() in text
+        assert f"User: {username}".encode() in text
+        assert f"Cost Index: 1.{n:04d}".encode() in text
+        for other in range(SESSIONS):
+            if other != n:
+                assert f"(Heading for session {other})".encode() not in text
+
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,51 @@
+import pytest
+
+from estimate import Estimate, LineItem
+from grid_editor import apply_grid_edits
+
+
+def five_lines():
+    estimate = Estimate()
+    for i in range(5):
+        estimate.append(LineItem.standard(f"I{i}", 1.0, 100 * (i + 1), "Nos"))
+    return estimate
+
+
+def names(estimate):
+    return [item.name for item in estimate]
+
+
+@pytest.mark.parametrize("row, order, expected", [
+    (2, 1, ["I2", "I0", "I1", "I3", "I4"]),   # up to first
+    (3, 3, ["I0", "I1", "I3", "I2", "I4"]),   # up by one
+    (0, 2, ["I1", "I0", "I2", "I3", "I4"]),   # down by one
+    (2, 4, ["I0", "I1", "I3", "I2", "I4"]),   # down by one, mid list
+    (0, 5, ["I1", "I2", "I3", "I4", "I0"]),   # down to last
+    (1, 9, ["I0", "I2", "I3", "I4", "I1"]),   # past the end
+])
+def test_move_one_line(row, order, expected):
+    estimate = five_lines()
+    changed, errors = apply_grid_edits(estimate, {row: {"Order": order}})
+    assert (changed, errors) == (1, [])
+    assert names(estimate) == expected
+
+
+def test_unchanged_order_is_not_an_edit():
+    estimate = five_lines()
+    version = estimate.version
+    assert apply_grid_edits(estimate, {1: {"Order": 2}}) == (0, [])
+    assert estimate.version == version
+
+
+def test_move_with_removed_line():
+    estimate = five_lines()
+    apply_grid_edits(estimate, {0: {"Remove": True}, 1: {"Order": 5}})
+    assert names(estimate) == ["I2", "I3", "I4", "I1"]
+
+
+def test_missing_order_applies_nothing():
+    estimate = five_lines()
+    version = estimate.version
+    changed, errors = apply_grid_edits(estimate, {0: {"Order": None}, 1: {"Quantity": 3.0}})
+    assert changed == 0 and len(errors) == 1
+    assert estimate.version == version and estimate[1].quantity == 1.0
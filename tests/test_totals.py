@@ -0,0 +1,132 @@
+import random
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+
+from estimate import Estimate, LineItem, compute_totals, line_cost
+
+
+# 1. REFERENCE: the original calculate_totals loop (streamlit_app.py before user-006),
+# kept verbatim apart from taking the items as an argument
+def reference_totals(selected_items):
+    total_cost = sum(
+        Decimal(str(item['Cost']))
+        for item in selected_items
+        if item.get('Type') != 'Subheading'
+    )
+
+    taxable_amount = sum(
+        Decimal(str(item['Cost']))
+        for item in selected_items
+        if item.get('Type') != 'Subheading' and item.get('GST_Applicable', True)
+    )
+
+    gst = (taxable_amount * Decimal('0.18')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    # Base unforeseen = 1% of total cost, capped at ₹10,000
+    base_unforeseen = min((total_cost * Decimal('0.01')).quantize(Decimal('0.01')), Decimal('10000.00'))
+
+    # Adjust unforeseen downward to make final_total a multiple of 1000
+    step = Decimal('0.01')
+    unforeseen = base_unforeseen
+    while unforeseen >= Decimal('0.00'):
+        final_total = total_cost + gst + unforeseen
+        if final_total % 1000 == 0:
+            break
+        unforeseen -= step
+
+    # Fallback (should not happen)
+    if unforeseen < 0:
+        unforeseen = Decimal('0.00')
+        final_total = (total_cost + gst + unforeseen).quantize(Decimal('0.01'))
+
+    return float(total_cost), float(gst), float(unforeseen), float(final_total)
+
+
+def as_dicts(line_items):
+    """LineItems in the shape the old loop read (Cost in rupees)"""
+    return [{'Type': item.item_type, 'Cost': item.cost / 100, 'GST_Applicable': item.gst_applicable}
+            for item in line_items]
+
+
+def in_rupees(totals):
+    return tuple(paise / 100 for paise in totals)
+
+
+# 2. RANDOMIZED ESTIMATES
+def random_lines(rng):
+    lines = []
+    for _ in range(rng.randint(0, 40)):
+        kind = rng.random()
+        if kind < 0.1:
+            lines.append(LineItem.subheading(f"Part {len(lines)}"))
+        elif kind < 0.3:
+            lines.append(LineItem.other("Custom", rng.randint(0, 5_000_000), rng.random() < 0.5))
+        else:
+            quantity = round(rng.uniform(0.01, 200), rng.choice([0, 2, 3]))
+            lines.append(LineItem.standard("Item", quantity, rng.randint(1, 2_000_000), "m",
+                                           gst_applicable=rng.random() < 0.8))
+    return lines
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_estimates_match_reference(seed):
+    rng = random.Random(seed)
+    lines = random_lines(rng)
+    estimate = Estimate(lines)
+    assert in_rupees(estimate.totals()) == reference_totals(as_dicts(lines))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_totals_match_reference(seed):
+    # Any subtotal/taxable pair, including zero and negative subtotals and taxable > subtotal
+    rng = random.Random(1000 + seed)
+    total_cost = rng.choice([0, rng.randint(-5_000_000, 0), rng.randint(1, 100_000), rng.randint(1, 200_000_000)])
+    taxable = rng.choice([0, total_cost, rng.randint(min(total_cost, 0), max(total_cost, 0))])
+    items = [{'Cost': taxable / 100}, {'Cost': (total_cost - taxable) / 100, 'GST_Applicable': False}]
+    assert in_rupees(compute_totals(total_cost, taxable)) == reference_totals(items)
+
+
+@pytest.mark.parametrize("total_cost", [0, 1, 99, 100_000, -100, -99_999_999])
+def test_zero_and_negative_subtotals(total_cost):
+    items = [{'Cost': total_cost / 100}]
+    assert in_rupees(compute_totals(total_cost, total_cost)) == reference_totals(items)
+
+
+def test_fallback_case():
+    # ₹1,234.56 + 18% GST: the 1% base (₹12.35) can't reach a multiple of ₹1,000
+    cost = line_cost(1, 123456)
+    estimate = Estimate([LineItem.standard("Item", 1, 123456, "m")])
+    total_cost, gst, unforeseen, final_total = estimate.totals()
+    assert unforeseen == 0 and final_total == total_cost + gst
+    assert in_rupees(estimate.totals()) == reference_totals([{'Cost': cost / 100}])
+
+
+def test_reaches_multiple_of_1000():
+    for seed in range(50):
+        lines = random_lines(random.Random(5000 + seed))
+        total_cost, gst, unforeseen, final_total = Estimate(lines).totals()
+        if unforeseen:
+            assert final_total % (1000 * 100) == 0
+            assert final_total == total_cost + gst + unforeseen
+
+
+# 3. TIMINGS (python -m tests.test_totals, from the repo root)
+if __name__ == "__main__":
+    rng = random.Random(0)
+    cases = [random_lines(rng) for _ in range(100)]
+    start = time.perf_counter()
+    for lines in cases:
+        reference_totals(as_dicts(lines))
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    for lines in cases:
+        Estimate(lines).totals()
+    closed = time.perf_counter() - start
+    start = time.perf_counter()
+    for lines in cases:
+        compute_totals(12_345_678, 9_876_543)
+    bare = time.perf_counter() - start
+    print(f"{len(cases)} random estimates: reference loop {loop:.3f} s, "
+          f"Estimate(...).totals() {closed:.4f} s, compute_totals alone {bare * 1e6 / len(cases):.1f} us/call")
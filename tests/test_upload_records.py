@@ -0,0 +1,106 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from catalog import RateCatalog
+from estimate import METADATA_SHEET, Estimate, LineItem, decode_records, encode_records
+from exports import build_excel
+from upload_parser import parse_upload
+
+
+def make_catalog(rates, sheet_name="alice", version=(1, 100)):
+    frame = pd.DataFrame({
+        'Item Name': list(rates),
+        'Unit Price': list(rates.values()),
+        'Item Unit': ['Nos'] * len(rates),
+    })
+    return RateCatalog(frame, sheet_name, version)
+
+
+def exported(catalog):
+    estimate = Estimate()
+    estimate.append(LineItem.subheading("Section A"))
+    estimate.append(catalog.line_item("Pipe", 3.0, gst_applicable=False, remarks="6 m lengths"))
+    estimate.append(catalog.line_item("Valve", 2.0))
+    estimate.append(LineItem.other("Transport", 150000, remarks="lump sum"))
+    return estimate, build_excel(estimate, "Heading", rates=catalog.stamp)
+
+
+def test_same_rates_add_lines_as_saved():
+    catalog = make_catalog({"Pipe": 120.5, "Valve": 999.99})
+    estimate, data = exported(catalog)
+    parsed = parse_upload(io.BytesIO(data))
+    assert parsed.stamp == catalog.stamp
+
+    line_items, unmatched = parsed.line_items(catalog)
+    assert unmatched == []
+    assert [(item.name, item.cost, item.gst_applicable, item.remarks) for item in line_items] == \
+           [(item.name, item.cost, item.gst_applicable, item.remarks) for item in estimate]
+
+
+@pytest.mark.parametrize("other", [
+    make_catalog({"Pipe": 130, "Valve": 500}, sheet_name="bob"),       # another user's rates
+    make_catalog({"Pipe": 130, "Valve": 500}, version=(2, 100)),       # items.xltm changed since
+])
+def test_other_rates_are_repriced(other):
+    _, data = exported(make_catalog({"Pipe": 120.5, "Valve": 999.99}))
+    line_items, unmatched = parse_upload(io.BytesIO(data)).line_items(other)
+    assert unmatched == []
+
+    pipe, valve, transport = line_items[1:]
+    assert (pipe.unit_price, pipe.quantity, pipe.cost) == (13000, 3.0, 39000)
+    assert (pipe.gst_applicable, pipe.remarks) == (False, "6 m lengths")
+    assert (valve.unit_price, valve.cost, valve.gst_applicable) == (50000, 100000, True)
+    assert (transport.item_type, transport.cost, transport.remarks) == ("Other", 150000, "lump sum")
+
+
+def test_items_no_longer_in_catalog_become_other_lines():
+    _, data = exported(make_catalog({"Pipe": 120.5, "Valve": 999.99}))
+    line_items, unmatched = parse_upload(io.BytesIO(data)).line_items(make_catalog({"Pipe": 120.5}, version=(2, 1)))
+    valve = line_items[2]
+    assert (valve.item_type, valve.cost) == ("Other", 199998)
+    assert unmatched == [{'Row': 3, 'Item Name': "Valve"}]
+
+
+def test_exports_without_a_stamp_are_repriced():
+    catalog = make_catalog({"Pipe": 120.5, "Valve": 999.99})
+    estimate, _ = exported(catalog)
+    parsed = parse_upload(io.BytesIO(build_excel(estimate, "Heading")))
+    assert parsed.batch is not None and parsed.stamp is None
+    line_items, _ = parsed.line_items(catalog)
+    assert [item.cost for item in line_items] == [item.cost for item in estimate]
+
+
+@pytest.mark.parametrize("field, value", [(5, 1), (2, 0), (2, -1.0), (3, -100), (5, "12050"), (6, "yes")])
+def test_tampered_standard_records_are_rejected(field, value):
+    record = json.loads("".join(encode_records([LineItem.standard("Pipe", 2.0, 12050, "Nos")])))
+    record[0][field] = value
+    with pytest.raises((ValueError, TypeError)):
+        decode_records([json.dumps(record)])
+
+
+def test_fractional_catalog_rates_pass_the_check():
+    catalog = make_catalog({"Pipe": 12.345})
+    item = catalog.line_item("Pipe", 7.0)
+    assert item.cost == 8642 and item.unit_price == 1235   # 86.415 -> 86.42, not 7 x 12.35
+    assert decode_records(encode_records([item]))[0].cost == item.cost
+
+
+def test_tampered_file_falls_back_to_the_visible_sheet():
+    catalog = make_catalog({"Pipe": 120.5, "Valve": 999.99})
+    _, data = exported(catalog)
+    wb = load_workbook(io.BytesIO(data))
+    records = wb[METADATA_SHEET]
+    text = records["A2"].value
+    records["A2"] = text.replace(str(36150), str(1))   # Pipe's cost
+    buffer = io.BytesIO()
+    wb.save(buffer)
+
+    parsed = parse_upload(io.BytesIO(buffer.getvalue()))
+    assert parsed.batch is None
+    line_items, unmatched = parsed.line_items(catalog)
+    assert line_items[1].cost == 36150
+    assert unmatched == [{'Row': 4, 'Item Name': "Transport"}]   # the visible sheet can't tell it's a custom line
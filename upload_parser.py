@@ -0,0 +1,329 @@
+import hashlib
+import io
+import itertools
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from collections import OrderedDict
+from xml.etree import ElementTree
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils import range_boundaries
+
+from estimate import METADATA_SHEET, METADATA_MARK, METADATA_VERSION, LineBatch, RowDigest, decode_records, rupees
+
+
+class UploadFormatError(ValueError):
+    """The uploaded workbook doesn't have the layout the parser expects"""
+
+
+# 1. MERGED-RANGE INDEX (ONE PASS OVER THE SHEET'S MERGED RANGES)
+def index_merged_rows(merges):
+    """
+    merges: (min_col, min_row, max_col, max_row) tuples in sheet order.
+    Returns (subheadings, subtotal_cells):
+    - subheadings: row -> first column of the first single-row merge covering column B
+    - subtotal_cells: row -> [(first column, order)] for every single-row merge; the
+      Subtotal row is the first of these (in sheet order) whose cell says "Subtotal"
+    """
+    subheadings = {}
+    subtotal_cells = {}
+    for order, (min_col, min_row, max_col, max_row) in enumerate(merges):
+        if min_row != max_row:  # Only consider row merges
+            continue
+        if min_col <= 2 and max_col >= 2:  # Merge includes column B (or first column)
+            subheadings.setdefault(min_row, min_col)
+        subtotal_cells.setdefault(min_row, []).append((min_col, order))
+    return subheadings, subtotal_cells
+
+
+def read_merged_ranges(source, sheet_path):
+    """
+    Stream the <mergeCell ref="A5:G5"/> entries out of one sheet's XML inside the
+    .xlsx, without building the sheet. Finished rows are dropped as they go by,
+    so memory doesn't grow with the sheet.
+    """
+    with zipfile.ZipFile(source) as archive, archive.open(sheet_path) as xml:
+        parent = None
+        for event, element in ElementTree.iterparse(xml, events=('start', 'end')):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if tag in ('sheetData', 'mergeCells'):
+                    parent = element
+                continue
+            if tag == 'mergeCell':
+                yield range_boundaries(element.get('ref'))
+            if tag in ('row', 'mergeCell') and parent is not None:
+                element.clear()
+                parent.remove(element)
+
+
+# 2. UPLOAD PARSER
+def _cell(values, column):
+    return values[column - 1] if column <= len(values) else None
+
+
+def _split_quantity(quantity_cell):
+    """'12.5 (as per drawing)' -> (12.5, 'as per drawing'); '-' or text -> (None, remark)"""
+    quantity_str = str(quantity_cell).strip() if quantity_cell is not None else ""
+    remarks = ""
+
+    if "(" in quantity_str and ")" in quantity_str:
+        parts = quantity_str.split("(", 1)
+        remarks = parts[1].split(")", 1)[0].strip()
+
+    quantity = None
+    if quantity_str and quantity_str != "-":
+        try:
+            quantity = float(quantity_str.split("(")[0].strip())
+        except ValueError:
+            pass
+    return quantity, remarks
+
+
+def parse_rows(rows, merges):
+    """
+    Items of an uploaded estimate (subheadings included, in sheet order).
+    rows: row value tuples from row 1 on; merges: the sheet's merged ranges
+    (see index_merged_rows). Rows are consumed once, front to back.
+    App estimates (row 2: B = Item Name, E = Qty) are read from row 3 up to the
+    Subtotal row (B = name, E = qty, F = total); other files from every row
+    (A = name, B = qty, C = total).
+    """
+    subheadings, subtotal_cells = index_merged_rows(merges)
+    rows = iter(rows)
+    head = list(itertools.islice(rows, 2))
+    app_estimate = len(head) == 2 and _cell(head[1], 2) == "Item Name" and _cell(head[1], 5) == "Qty"
+
+    if app_estimate:
+        first_row = 3
+        name_col, quantity_col, total_col = 2, 5, 6
+    else:
+        first_row = 1
+        name_col, quantity_col, total_col = 1, 2, 3
+
+    items = []              # (row, item) so app estimates can be cut at the Subtotal row
+    subtotal = None         # (merge order, row) of the first "Subtotal" merge seen so far
+    current_subheading = None
+    for row, values in enumerate(itertools.chain(head, rows), start=1):
+        for column, order in subtotal_cells.get(row, ()):
+            if _cell(values, column) == "Subtotal" and (subtotal is None or order < subtotal[0]):
+                subtotal = (order, row)
+        if row < first_row:
+            continue
+
+        merge_col = subheadings.get(row)
+        if merge_col is not None:
+            current_subheading = _cell(values, merge_col)
+            items.append((row, {
+                'Item Name': current_subheading,
+                'Type': 'Subheading',
+                'Merged': True
+            }))
+            continue
+
+        item_name = _cell(values, name_col)
+        # Skip empty rows
+        if not item_name:
+            continue
+
+        quantity, remarks = _split_quantity(_cell(values, quantity_col))
+
+        total_price = 0.0
+        total_price_cell = _cell(values, total_col)
+        if total_price_cell is not None:
+            try:
+                total_price = float(total_price_cell)
+            except (ValueError, TypeError):
+                pass
+
+        items.append((row, {
+            'Item Name': item_name,
+            'Quantity': quantity,
+            'Remarks': remarks,
+            'Total Price': total_price,
+            'Subheading': current_subheading  # Track which subheading this item belongs to
+        }))
+
+    if app_estimate:
+        if subtotal is None:
+            raise UploadFormatError("Could not find 'Subtotal' row in the uploaded estimate")
+        return [item for row, item in items if row < subtotal[1]]
+    return [item for row, item in items]
+
+
+def parse_worksheet(ws):
+    """Items from a fully loaded openpyxl worksheet"""
+    merges = [merge.bounds for merge in ws.merged_cells.ranges]
+    return parse_rows(ws.iter_rows(min_row=1, min_col=1, values_only=True), merges)
+
+
+def read_line_records(rows):
+    """
+    (line items, visible-sheet digest, rate stamp) from the rows of an exported
+    workbook's hidden records sheet, or None if the sheet isn't one we can read.
+    The stamp is the (sheet name, version) of the rates the lines were priced
+    from (see RateCatalog.stamp), None for exports made before it was recorded.
+    """
+    rows = iter(rows)
+    head = next(rows, None)
+    if not head or len(head) < 4 or head[0] != METADATA_MARK or head[1] != METADATA_VERSION:
+        return None
+    try:
+        line_items = decode_records(values[0] for values in rows if values and values[0])
+    except (ValueError, TypeError, IndexError):
+        return None
+    if len(line_items) != head[2]:
+        return None
+    stamp = (head[4], head[5]) if len(head) >= 6 and head[4] is not None else None
+    return line_items, head[3], stamp
+
+
+def records_frame(line_items):
+    """Preview frame for line items loaded from records (same columns as parse_rows)"""
+    rows = []
+    current_subheading = None
+    for item in line_items:
+        if item.is_subheading:
+            current_subheading = item.name
+            rows.append({'Item Name': item.name, 'Type': 'Subheading', 'Merged': True})
+        else:
+            rows.append({
+                'Item Name': item.name,
+                'Type': item.item_type,
+                'Quantity': item.quantity,
+                'Remarks': item.remarks,
+                'GST': item.gst_applicable,
+                'Total Price': rupees(item.cost),
+                'Subheading': current_subheading
+            })
+    return pd.DataFrame(rows)
+
+
+class ParsedUpload:
+    """
+    items: DataFrame of the uploaded rows (preview, catalog join).
+    batch: the exact lines when the file is one of our own unedited exports, else None.
+    stamp: the rates batch was priced from (see read_line_records). Only add batch
+    as it is when this matches the uploader's catalog; otherwise re-price items.
+    """
+
+    __slots__ = ('items', 'batch', 'stamp')
+
+    def __init__(self, items, batch=None, stamp=None):
+        self.items = items
+        self.batch = batch
+        self.stamp = stamp
+
+    def line_items(self, catalog):
+        """(line items, unmatched) for this upload, priced from catalog's rates (see RateCatalog.build_line_items)"""
+        if self.batch is not None and self.stamp == catalog.stamp:
+            return self.batch, []
+        return catalog.build_line_items(self.items)
+
+
+def parse_upload(uploaded_file):
+    """
+    Parse an uploaded .xlsx (path or file object) into a ParsedUpload.
+    Our own exports are loaded straight from their hidden records sheet, provided
+    the visible sheet still matches the digest stored with them. Anything else
+    (other files, edited exports) streams the visible rows in read-only mode and
+    takes the merged ranges straight from the sheet XML, so memory stays flat
+    however large the workbook is.
+    """
+    wb = load_workbook(uploaded_file, read_only=True)
+    try:
+        ws = wb.active
+        if METADATA_SHEET in wb.sheetnames:
+            recorded = read_line_records(wb[METADATA_SHEET].iter_rows(values_only=True))
+            if recorded is not None:
+                line_items, expected, stamp = recorded
+                digest = RowDigest()
+                for values in ws.iter_rows(values_only=True):
+                    digest.update(values)
+                if digest.hexdigest() == expected:
+                    return ParsedUpload(records_frame(line_items), LineBatch(line_items), stamp)
+            # Edited since export (or damaged): read it like any other file
+
+        merges = list(read_merged_ranges(uploaded_file, ws._worksheet_path))
+        return ParsedUpload(pd.DataFrame(parse_rows(ws.iter_rows(min_row=1, min_col=1, values_only=True), merges)))
+    finally:
+        wb.close()
+
+
+# 3. PARSED-UPLOAD CACHE (SHA-256 OF THE FILE BYTES -> PARSED ITEMS)
+class UploadCache:
+    """
+    Small LRU of parsed uploads (ParsedUpload), bounded by the memory of their frames.
+    Kept in session state so reruns (preview, Add Uploaded Items, unrelated
+    widgets) reuse one parse of the same file. Cached frames are shared
+    between reruns, so callers must treat them as read-only.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # digest -> (frame, size)
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, data):
+        """ParsedUpload for the given file bytes, parsing them only on a miss"""
+        digest = hashlib.sha256(data).hexdigest()
+        entry = self._entries.get(digest)
+        if entry is not None:
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+        parsed = parse_upload(io.BytesIO(data))
+        size = int(parsed.items.memory_usage(index=True, deep=True).sum())
+        self._entries[digest] = (parsed, size)
+        self._size += size
+        # Evict least recently used, but always keep the file just parsed
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= evicted
+        return parsed
+
+
+# 4. BENCHMARK
+def build_sample_estimate(path, rows=10000, merges=2000):
+    """Write an app-style estimate with `rows` item rows and `merges` subheading rows"""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Sl No", "Item Name", "Rate", "Unit", "Qty", "Total", "GST"])
+    ws.append(["Sl No", "Item Name", "Rate", "Unit", "Qty", "Total", "GST"])
+    every = max(1, rows // max(1, merges))
+    row_num = 3
+    for i in range(rows):
+        if i % every == 0 and i // every < merges:
+            ws.merge_cells(f'A{row_num}:G{row_num}')
+            ws[f'A{row_num}'] = f" Section {i // every + 1}"
+            row_num += 1
+        ws.append([i + 1, f"Item {i}", 100.0, "Nos", f"{i % 7 + 1} (site {i})", (i % 7 + 1) * 100.0, "Yes"])
+        row_num += 1
+    for label in ("Subtotal", "GST (18%)", "Unforeseen (1%)", "Grand Total"):
+        ws.merge_cells(f'A{row_num}:E{row_num}')
+        ws[f'A{row_num}'] = label
+        row_num += 1
+    wb.save(path)
+
+
+if __name__ == "__main__":
+    # python upload_parser.py [rows] [merges]
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    merges = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    sample = os.path.join(tempfile.gettempdir(), "upload_benchmark.xlsx")
+    build_sample_estimate(sample, rows, merges)
+
+    started = time.perf_counter()
+    wb = load_workbook(sample)
+    loaded = time.perf_counter()
+    items = parse_worksheet(wb.active)
+    parsed = time.perf_counter()
+    print(f"{rows} rows, {merges} merges: load {loaded - started:.2f}s, parse {parsed - loaded:.3f}s, "
+          f"{len(items)} entries")
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+import pandas as pd
+
+# Compiled copies of the Excel workbooks live here, one pickle per workbook.
+# Run `python workbook_cache.py items.xltm Templates.xlsx` to compile ahead of
+# time; otherwise the first read after a change compiles automatically.
+CACHE_DIR = ".workbook_cache"
+CACHE_VERSION = 1
+
+
+def _checksum(path):
+    """SHA-256 of the workbook bytes"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(path):
+    return os.path.join(CACHE_DIR, os.path.basename(path) + ".pkl")
+
+
+def _write_entry(path, entry):
+    """Atomically replace the compiled file (ignored if the folder is read-only)"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _cache_path(path))
+    except OSError:
+        pass
+
+
+def compile_workbook(path):
+    """Parse every sheet of a workbook once and store the frames as a pickle"""
+    stat = os.stat(path)
+    entry = {
+        'version': CACHE_VERSION,
+        'pandas': pd.__version__,
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'checksum': _checksum(path),
+        'sheets': pd.read_excel(path, sheet_name=None),
+    }
+    _write_entry(path, entry)
+    return entry
+
+
+def _load_entry(path):
+    stat = os.stat(path)
+    # Anything unreadable - truncated, foreign, written by another pandas/numpy
+    # (missing modules, changed classes) - is recompiled rather than raised
+    try:
+        with open(_cache_path(path), "rb") as f:
+            entry = pickle.load(f)
+        if (not isinstance(entry, dict) or entry.get('version') != CACHE_VERSION
+                or entry.get('pandas') != pd.__version__ or not isinstance(entry['sheets'], dict)):
+            return compile_workbook(path)
+        unchanged = entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size
+        same_size = entry['size'] == stat.st_size
+        checksum = entry['checksum']
+    except Exception:
+        return compile_workbook(path)
+
+    if unchanged:
+        return entry
+
+    # The timestamp moved (fresh checkout, copy, touch) - only re-parse if the bytes changed
+    if same_size and checksum == _checksum(path):
+        entry['mtime'] = stat.st_mtime_ns
+        _write_entry(path, entry)
+        return entry
+
+    return compile_workbook(path)
+
+
+def workbook_version(path):
+    """Cheap version stamp for a workbook (changes whenever the file is replaced or edited)"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_workbook(path, sheet_name=0):
+    """
+    Drop-in replacement for pd.read_excel(path, sheet_name=...) served from the compiled cache.
+    sheet_name may be a sheet name, a sheet position, or None for a dict of all sheets.
+    """
+    sheets = _load_entry(path)['sheets']
+    if sheet_name is None:
+        return sheets
+    if isinstance(sheet_name, int):
+        return list(sheets.values())[sheet_name]
+    if sheet_name not in sheets:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    return sheets[sheet_name]
+
+
+# Compile step
+if __name__ == "__main__":
+    for workbook in sys.argv[1:] or ["items.xltm", "Templates.xlsx"]:
+        compiled = compile_workbook(workbook)
+        print(f"Compiled {workbook}: {len(compiled['sheets'])} sheets -> {_cache_path(workbook)}")